@@ -36,6 +36,35 @@ search for solution is a function that looks like this
 def search_for_solution(csp, assignment):
 """
 
+from collections import OrderedDict
+import itertools
+import json
+import os
+import time
+
+# ways of propagating an assignment to the domains of the unassigned variables (see CSP.search_in_place)
+
+FORWARD_CHECKING = 'forward_checking'
+ARC_CONSISTENCY = 'arc_consistency'
+
+# variable and value ordering heuristics (see CSP.search_in_place)
+
+MINIMUM_REMAINING_VALUES = 'mrv'
+DEGREE = 'degree'
+DOM_WDEG = 'dom_wdeg'
+LEAST_CONSTRAINING_VALUE = 'lcv'
+
+# the most nogoods a backjumping search keeps, and the most pairs a nogood may have to be kept (see NogoodStore)
+
+NOGOOD_LIMIT = 10000
+NOGOOD_SIZE_LIMIT = 6
+
+# the most value combinations a constraint is tabulated over, and the most results a constraint too large
+# for that remembers (see CSP.tabulate)
+
+TABLE_LIMIT = 10000
+CACHE_SIZE = 10000
+
 # general methods
 
 def not_all_vars_are_assigned(vars, vals):
@@ -59,82 +88,1399 @@ def flatten(l):
             out.append(item)
     return out
 
-def _inner_prod(x1,x2):
-    return [flatten([x,y]) for x in x1 for y in x2]
-
 def cross_prod(list_of_lists):
-    if len(list_of_lists) == 0:
-        return [[]]
-    if len(list_of_lists) == 1:
-        return [[x] for x in list_of_lists[0]]
-    elif len(list_of_lists) == 2:
-        return _inner_prod(list_of_lists[0], list_of_lists[1])
-    else:
-        return _inner_prod(list_of_lists[0], cross_prod(list_of_lists[1:]))
+    """ yields the combinations of one item from each of the lists, as lists, one at a time, so the product is
+    never held in memory as a whole
+    """
+    for combination in itertools.product(*list_of_lists):
+        yield list(combination)
+
+def merge_list_of_maps(list_of_maps):
+    combined = {}
+    for amap in list_of_maps:
+        combined.update(amap)
+    return combined
+
+def _strongly_connected_components(edges):
+    """ Tarjan's algorithm: maps each node of the graph given as a dict from node to the list of its successors
+    to the number of its strongly connected component.  The depth first search keeps its path on an explicit
+    stack of (node, iterator over its successors), so the size of the graph is not bound by the recursion limit.
+    """
+    index = {}
+    low = {}
+    component = {}
+    stack = []
+    on_stack = set()
+    count = 0
+
+    for root in list(edges):
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        path = [(root, iter(edges.get(root, [])))]
+        while path:
+            node, successors = path[-1]
+            for succ in successors:
+                if succ not in index:
+                    index[succ] = low[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    path.append((succ, iter(edges.get(succ, []))))
+                    break
+                if succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+            else:
+                path.pop()
+                if path:
+                    parent = path[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component[member] = count
+                        if member == node:
+                            break
+                    count = count + 1
+    return component
+
+def first_component_solution(sub, var_order=None, val_order=None):
+    """ the first solution of the sub-problem sub (see CSP.search_by_components), or None if it has none """
+    if var_order is None and val_order is None:
+        return next(sub.iter_assignments(), None)
+    return sub.search_for_solution(var_order=var_order, val_order=val_order)
+
+def _mrv_key(csp, variable, state):
+    return (len(state.domains[variable]), -csp.degree(variable, state), csp.position[variable])
+
+def _degree_key(csp, variable, state):
+    return (-csp.degree(variable, state), csp.position[variable])
+
+def _dom_wdeg_key(csp, variable, state):
+    weighted_degree = csp.weighted_degree(variable, state)
+    ratio = len(state.domains[variable]) / weighted_degree if weighted_degree else float('inf')
+    return (ratio, csp.position[variable])
+
+def _solution_first(csp, variable, state):
+    """ the value order of CSP.resolve: the value variable had in the previous solution first, then the rest """
+    values = state.domains[variable]
+    previous = csp.solution.get(variable)
+    if previous not in values:
+        return values
+    return [previous] + [x for x in values if x != previous]
 
 class CSP:
+    __slots__ = ('variables', 'domains', 'constraints', 'constraints_for_variable', 'position', 'counter',
+                 'pruned', '_supports', 'weights', 'REPORT_INTERVAL', 'next_report', 'stats', 'listeners',
+                 'solution', 'nogoods', 'propagated', '_pending')
+    _variable_keys = {
+        MINIMUM_REMAINING_VALUES: _mrv_key,
+        DEGREE: _degree_key,
+        DOM_WDEG: _dom_wdeg_key,
+    }
+
     def __init__(self, variables, domains, constraints):
         self.variables = variables
         self.domains = domains
         self.constraints = constraints
         self.constraints_for_variable = {}
+        self.position = {v: i for (i, v) in enumerate(variables)}
         self.counter = 0
+        self.pruned = 0
+        self._supports = {}
+        self.weights = {}
         self.REPORT_INTERVAL = 50000
-        for v in variables:
+        self.next_report = self.REPORT_INTERVAL
+        self.stats = None
+        self.listeners = []
+        self.solution = None
+        self.nogoods = None
+        self.propagated = None
+        self._pending = []
+        self._index_constraints()
+
+    def _index_constraints(self):
+        for v in self.variables:
             self.constraints_for_variable[v] = []
         for c in self.constraints:
             if c.var_list is None:
-                for v in variables:
-                    self.constraints_for_variable[v].append(c)      
+                for v in self.variables:
+                    self.constraints_for_variable[v].append(c)
             else:
                 for v in c.var_list:
                     self.constraints_for_variable[v].append(c)
 
     def is_variable_consistent(self, var, assignment):
+        if self.stats is not None:
+            return self._timed_failed_constraint(var, assignment) is None
         for constraint in self.constraints_for_variable[var]:
-            if not constraint.is_satisfied(assignment):
+            if constraint.prunes_early:
+                if not constraint.is_satisfied_after(var, assignment):
+                    return False
+            elif not constraint.is_satisfied(assignment):
                 return False
         return True
 
+    def failed_constraint(self, var, assignment):
+        """ returns the first constraint on var that the assignment violates, or None if there is none """
+        if self.stats is not None:
+            return self._timed_failed_constraint(var, assignment)
+        for constraint in self.constraints_for_variable[var]:
+            if constraint.prunes_early:
+                if not constraint.is_satisfied_after(var, assignment):
+                    return constraint
+            elif not constraint.is_satisfied(assignment):
+                return constraint
+        return None
+
+    def _timed_failed_constraint(self, var, assignment):
+        stats = self.stats
+        for constraint in self.constraints_for_variable[var]:
+            start = time.perf_counter()
+            if constraint.prunes_early:
+                satisfied = constraint.is_satisfied_after(var, assignment)
+            else:
+                satisfied = constraint.is_satisfied(assignment)
+            stats.record_check(constraint, time.perf_counter() - start)
+            if not satisfied:
+                return constraint
+        return None
+
     def assignments_generator(self, constr, assignments):
         """ returns a generator of assignments based on the constraint constr provided as an argument
-        all assignments returned are built on top of the assignments provided as an argument
+        all assignments returned are built on top of the assignments provided as an argument, which can be
+        a generator too: each one is only taken when the previous one has been extended in every way.
+        The unassigned variables of constr are added one at a time in the order of its var_list, and the
+        constraint is checked as each one is added, so a constraint like AllDifferent can reject a partial
+        assignment early, and the propagator of the constraint (see Constraint.revise) narrows the values
+        tried for each variable.
+        """
+        for assignment in assignments:
+            unassigned = [v for v in constr.var_list if v not in assignment]
+            if not unassigned:
+                if constr.is_satisfied(assignment):
+                    yield assignment
+                continue
+            yield from self._extend_assignment(constr, unassigned, 0, dict(assignment))
+
+    def _extend_assignment(self, constr, unassigned, depth, assignment):
+        if depth == len(unassigned):
+            yield assignment.copy()
+            return
+        var = unassigned[depth]
+        candidates = {v: [assignment[v]] if v in assignment else self.domains[v] for v in constr.var_list if v != var}
+        values = constr.revise(var, self.domains[var], candidates)
+        if values is None:
+            values = self.domains[var]
+        for value in values:
+            assignment[var] = value
+            if constr.is_satisfied(assignment):
+                yield from self._extend_assignment(constr, unassigned, depth + 1, assignment)
+        assignment.pop(var, None)
+
+    def sub_problems(self):
+        """ splits the problem into independent sub-problems by finding the connected components of the
+        hypergraph whose nodes are the variables and whose edges are the var_lists of the constraints.
+        Each component is returned as its own CSP holding just its variables, their domains and the constraints
+        between them.  Global constraints (those with no var_list) are left out, as they link every component;
+        they are checked by search_by_components when the component solutions are combined.
+        Components are returned in the order of their first variable in self.variables.
         """
+        parent = {v: v for v in self.variables}
+
+        def find(v):
+            while parent[v] != v:
+                parent[v] = parent[parent[v]]
+                v = parent[v]
+            return v
+
+        for c in self.constraints:
+            if c.var_list:
+                root = find(c.var_list[0])
+                for v in c.var_list[1:]:
+                    parent[find(v)] = root
+
+        component_variables = {}
+        for v in self.variables:
+            component_variables.setdefault(find(v), []).append(v)
+        component_constraints = {root: [] for root in component_variables}
+        for c in self.constraints:
+            if c.var_list:
+                component_constraints[find(c.var_list[0])].append(c)
+
+        sub_problems = []
+        for root, variables in component_variables.items():
+            domains = {v: self.domains[v] for v in variables}
+            sub_problems.append(CSP(variables, domains, component_constraints[root]))
+        return sub_problems
+
+    def global_constraints(self):
+        return [c for c in self.constraints if c.var_list is None]
+
+    def constraint_join_order(self):
+        """ orders the constraints so that each one introduces as few new variables as possible given the
+        variables of the constraints before it, which keeps the number of partial assignments built by
+        iter_assignments small.
+        Ties are broken by the position of the constraint in self.constraints.
+        """
+        remaining = [c for c in self.constraints if c.var_list]
+        covered = set()
+        order = []
+        while remaining:
+            best = min(remaining, key=lambda c: len(set(c.var_list) - covered))
+            remaining.remove(best)
+            covered.update(best.var_list)
+            order.append(best)
+        return order
+
+    def iter_assignments(self):
+        """ yields the assignments to self.variables that satisfy every constraint, one at a time.
+        The constraints are joined in a pipeline of assignments_generator calls, so only the partial assignment
+        being extended is held at each stage rather than a table of all of them.
+        """
+        assignments = iter([{}])
+        for constraint in self.constraint_join_order():
+            assignments = self.assignments_generator(constraint, assignments)
+        covered = set()
+        for c in self.constraints:
+            if c.var_list:
+                covered.update(c.var_list)
+        free = [v for v in self.variables if v not in covered]
         for assignment in assignments:
-            assigned_vars = list(assignment.keys())
-            constraint_vars = constr.var_list
-            unassigned_constraint_vars = list(set(constraint_vars) - set(assigned_vars))
-            domain_val_pairs = [[(v, val) for val in self.domains[v]] for v in unassigned_constraint_vars]
-            all_new_assignments = cross_prod(domain_val_pairs)
-            for a in all_new_assignments:
-                asn = {k:v for (k,v) in a}
-                local_assignment = assignment.copy()
-                local_assignment.update(asn)
-                if constr.is_satisfied(local_assignment):
-                    yield(local_assignment)
-
-    def search_for_solution(self, assignment={}, interval=None):
+            for values in itertools.product(*[self.domains[v] for v in free]):
+                solution = assignment.copy()
+                solution.update(zip(free, values))
+                yield solution
+
+    def all_assignments(self):
+        """ returns the list of all the assignments to self.variables that satisfy every constraint """
+        return list(self.iter_assignments())
+
+    def relational_assignments(self):
+        """ returns the assignments that all_assignments does, found by joining the tables of the constraints
+        along a join tree with hash joins, after a semijoin reduction has dropped the rows that cannot be part
+        of a solution (see csp_relational.py).  Unlike all_assignments it checks the global constraints too.
+        """
+        from csp_relational import relational_assignments
+        return relational_assignments(self)
+
+    def search_by_components(self, interval=None, var_order=None, val_order=None, workers=None, relational=False):
+        """ solves each independent sub-problem on its own and then searches over the combinations of
+        their solutions, checking the global constraints as each component's solution is added.
+        Without global constraints the first solution of each component is taken directly, so the work
+        is the sum of the component sizes rather than their product, and only the first solution of each
+        component is ever generated.  There is then no combination search, so var_order and val_order
+        apply to the search of each component instead: with either of them given, each component is solved
+        by search_for_solution with those heuristics rather than by iter_assignments.
+
+        In the combination search the components play the part of the variables and their solutions the part
+        of the values, so var_order and val_order apply there: MINIMUM_REMAINING_VALUES picks the component with
+        the fewest solutions next, DEGREE the component with the most variables, and DOM_WDEG the one with the
+        fewest solutions per failed global check.  LEAST_CONSTRAINING_VALUE tries first the solutions that
+        conflict with the fewest solutions of the other components.
+
+        With workers set, the components are solved and their solutions combined by that many processes
+        (see csp_parallel.py); the solution found is the same as with one process.
+        With relational=True the solutions of each component are found by relational_assignments rather than
+        all_assignments.
+        """
+        if workers:
+            from csp_parallel import search_by_components_parallel
+            return search_by_components_parallel(self, workers, interval, var_order, val_order, relational)
+        self.start_reporting(interval)
+        global_constraints = self.global_constraints()
+        if not global_constraints and not relational:
+            firsts = [first_component_solution(sub, var_order, val_order) for sub in self.sub_problems()]
+            if any(first is None for first in firsts):
+                return None
+            return merge_list_of_maps(firsts)
+        if relational:
+            tables = [sub.relational_assignments() for sub in self.sub_problems()]
+        else:
+            tables = [sub.all_assignments() for sub in self.sub_problems()]
+        if any(len(t) == 0 for t in tables):
+            return None
+        if not global_constraints:
+            return merge_list_of_maps([t[0] for t in tables])
+        if val_order == LEAST_CONSTRAINING_VALUE:
+            tables = self._order_component_solutions(tables, global_constraints)
+        assignment = {}
+        remaining = list(range(len(tables)))
+        weights = [1] * len(tables)
+        if self._link_components(tables, remaining, weights, assignment, global_constraints, interval, var_order):
+            return assignment
+        return None
+
+    def _link_components(self, tables, remaining, weights, assignment, global_constraints, interval, var_order):
+        if not remaining:
+            return True
+        index = self._pick_component(tables, remaining, weights, var_order)
+        remaining.remove(index)
+        for partial in tables[index]:
+            assignment.update(partial)
+            self.counter = self.counter + 1
+            if self.counter >= self.next_report:
+                self.report(interval)
+            if all(c.is_satisfied(assignment) for c in global_constraints):
+                if self._link_components(tables, remaining, weights, assignment, global_constraints, interval,
+                                         var_order):
+                    return True
+            else:
+                weights[index] = weights[index] + 1
+            for v in partial:
+                del assignment[v]
+        remaining.append(index)
+        remaining.sort()
+        return False
+
+    def _pick_component(self, tables, remaining, weights, var_order):
+        """ returns the index of the component that the combination search adds next """
+        if var_order == MINIMUM_REMAINING_VALUES:
+            return min(remaining, key=lambda i: (len(tables[i]), i))
+        if var_order == DEGREE:
+            return min(remaining, key=lambda i: (-len(tables[i][0]), i))
+        if var_order == DOM_WDEG:
+            return min(remaining, key=lambda i: (len(tables[i]) / weights[i], i))
+        return remaining[0]
+
+    def _order_component_solutions(self, tables, global_constraints):
+        """ sorts the solutions of each component by how many solutions of the other components they
+        violate a global constraint with, fewest first
+        """
+        ordered = []
+        for (i, table) in enumerate(tables):
+            def conflicts(partial):
+                count = 0
+                for (j, other) in enumerate(tables):
+                    if j == i:
+                        continue
+                    for o in other:
+                        combined = dict(partial, **o)
+                        if not all(c.is_satisfied(combined) for c in global_constraints):
+                            count = count + 1
+                return count
+            ordered.append(sorted(table, key=conflicts))
+        return ordered
+
+    def compile(self):
+        """ returns the compiled, integer indexed form of this CSP (see csp_compiled.py) """
+        from csp_compiled import CompiledCSP
+        return CompiledCSP(self)
+
+    def tabulate(self, table_limit=TABLE_LIMIT, cache_size=CACHE_SIZE):
+        """ replaces each constraint that has a var_list by one that answers its checks by a lookup, relying on
+        the constraint being a function of the values of its var_list alone.  A constraint whose variables have
+        at most table_limit combinations of values between them becomes a TableConstraint, holding the set of
+        the combinations that satisfy it; any other becomes a CachedConstraint, which remembers the results
+        of up to cache_size of the combinations it is checked on.  Global constraints are left as they are.
+        The tables are built from the domains as they are now, so they must not be widened afterwards.
+        """
+        constraints = []
+        for c in self.constraints:
+            if c.var_list and not isinstance(c, (TableConstraint, CachedConstraint)):
+                size = 1
+                for v in c.var_list:
+                    size = size * len(self.domains[v])
+                if size <= table_limit:
+                    c = TableConstraint(c, [self.domains[v] for v in c.var_list])
+                elif cache_size:
+                    c = CachedConstraint(c, cache_size)
+            constraints.append(c)
+        self.constraints = constraints
+        self._supports = {}
+        self.weights = {}
+        self._index_constraints()
+
+    def add_constraint(self, constraint):
+        """ adds constraint to the problem, updating the index of the constraints of each variable in place
+        rather than building it again.  The list of constraints the problem was created with is not changed.
+        The nogoods learned and the domains propagated so far stay true, as a new constraint can only rule
+        out more; resolve revises just the new constraint against them.
+        """
+        self.constraints = self.constraints + [constraint]
+        for v in constraint.var_list if constraint.var_list is not None else self.variables:
+            self.constraints_for_variable[v].append(constraint)
+        if self.propagated is not None:
+            self._pending.append(constraint)
+
+    def remove_constraint(self, constraint):
+        """ removes constraint from the problem, updating the indexes in place.  The previous solution is
+        still a solution, but the nogoods and the propagated domains may now rule out too much, so they are
+        dropped.
+        """
+        self.constraints = list(self.constraints)
+        self.constraints.remove(constraint)
+        for v in constraint.var_list if constraint.var_list is not None else self.variables:
+            self.constraints_for_variable[v].remove(constraint)
+        self.weights.pop(constraint, None)
+        self._supports = {key: support for (key, support) in self._supports.items() if key[0] is not constraint}
+        self.nogoods = None
+        self.propagated = None
+        self._pending = []
+
+    def restrict_domain(self, variable, values):
+        """ narrows the domain of variable to those of its values that are in values.  The dict of domains
+        the problem was created with is not changed.  Like add_constraint this only rules out more, so the
+        nogoods and the propagated domains are kept, and resolve revises the constraints on variable.
+        """
+        values = set(values)
+        self.domains = dict(self.domains)
+        self.domains[variable] = [x for x in self.domains[variable] if x in values]
+        if self.propagated is not None:
+            self.propagated[variable] = [x for x in self.propagated[variable] if x in values]
+            self._pending.extend(c for c in self.constraints_for_variable[variable] if c.var_list)
+
+    def forget(self):
+        """ drops what earlier searches kept for the next one: the previous solution, the propagated domains, the
+        nogoods, the supports and the weights of the constraints.  Needed when the domains or the constants of
+        the constraints are changed in some other way than by the methods above, as csp_batch.py does.
+        """
+        self.solution = None
+        self.nogoods = None
+        self.propagated = None
+        self._pending = []
+        self._supports = {}
+        self.weights = {}
+
+    def resolve(self, interval=None, propagate=None, var_order=None, val_order=None, backjump=False):
+        """ searches for a solution with search_in_place, reusing what was found by the previous call after
+        the problem was changed by add_constraint, remove_constraint or restrict_domain.
+        If the previous solution still satisfies every constraint and lies in the domains, it is returned
+        straight away.  Otherwise it is the warm start of the search: unless a val_order is given, each
+        variable tries its value from the previous solution first.  With propagate=ARC_CONSISTENCY the domains
+        made arc consistent by the previous call are kept in self.propagated, and only the constraints added
+        or touched since are revised against them, rather than running AC-3 over every constraint again.  Those
+        are kept until a search with ARC_CONSISTENCY revises them, however many calls return the previous solution.
+        With backjump=True the nogoods learned by earlier searches are used as well.
+        The solution is kept in self.solution for the next call.
+        """
+        if backjump and propagate is not None:
+            raise ValueError('backjumping cannot be combined with propagation')
+        previous = self.solution
+        if previous is not None and self._still_solves(previous):
+            return previous
+        if val_order is None and previous is not None:
+            val_order = _solution_first
+        domains = None
+        if propagate == ARC_CONSISTENCY:
+            domains = self._propagate_changes()
+            if domains is None:
+                self.solution = None
+                return None
+        state = self._start_in_place({}, interval, propagate, var_order, val_order, domains)
+        self.solution = self._solve_in_place(state, backjump)
+        return self.solution
+
+    def _still_solves(self, assignment):
+        if any(v not in assignment or assignment[v] not in self.domains[v] for v in self.variables):
+            return False
+        return all(c.is_satisfied(assignment) for c in self.constraints)
+
+    def _propagate_changes(self):
+        """ returns the arc consistent domains of the problem as it is now, in self.propagated, found by revising
+        the constraints changed since the last time against the domains found then, or by running AC-3 over
+        every constraint if there are none yet.  Returns None if some variable is left without a value.
+        """
+        if self.propagated is None:
+            self.propagated = self.make_arc_consistent()
+        else:
+            state = SearchState({}, self.propagated, [])
+            arcs = [(c, v) for c in dict.fromkeys(self._pending) if c.var_list for v in c.var_list]
+            if not self._ac3(arcs, state):
+                self.propagated = None
+        self._pending = []
+        return self.propagated
+
+    def search_for_solution(self, assignment={}, interval=None, in_place=False, propagate=None,
+                            var_order=None, val_order=None, compiled=False, workers=None, iterative=False,
+                            backjump=False):
+        """ searches for an assignment to all the variables that satisfies every constraint, starting
+        from the (possibly partial) assignment provided as an argument.
+        With in_place=True the search is run by search_in_place, which modifies one shared assignment
+        rather than copying it at every node.  Setting propagate to FORWARD_CHECKING or ARC_CONSISTENCY
+        also prunes the domains of the unassigned variables as the search goes, and var_order and val_order
+        select the variable and value ordering heuristics; any of these implies in_place.
+        With compiled=True the search is run on the compiled form of the CSP returned by compile(), which has
+        no propagation, heuristics or backjumping, so it cannot be combined with propagate, var_order,
+        val_order or backjump.
+        With workers set, the search tree is split into subtrees that are searched in place by that many
+        processes (see csp_parallel.py).  With iterative=True the search is run by search_iterative, which
+        does not recurse and so works with any number of variables.  backjump=True selects the conflict-directed
+        backjumping of search_in_place, and implies in_place; search_iterative only backtracks chronologically,
+        so it cannot be combined with iterative.
+        """
+        if workers:
+            from csp_parallel import search_parallel
+            return search_parallel(self, assignment, workers, interval, propagate, var_order, val_order, backjump)
+        if iterative:
+            if backjump:
+                raise ValueError('backjumping cannot be combined with the iterative search')
+            return self.search_iterative(assignment, interval, propagate, var_order, val_order)
+        if compiled:
+            if backjump or propagate is not None or var_order is not None or val_order is not None:
+                raise ValueError('the compiled search cannot be combined with propagation, ordering heuristics '
+                                 'or backjumping')
+            return self.compile().search_for_solution(assignment, interval)
+        if in_place or backjump or propagate is not None or var_order is not None or val_order is not None:
+            return self.search_in_place(assignment, interval, propagate, var_order, val_order, backjump)
+        self.start_reporting(interval)
+        return self._search_copying(assignment, interval)
+
+    def _search_copying(self, assignment, interval):
         if len(self.variables) == len(assignment):
+            self._found_solution()
             return assignment
-        unassigned = list(set(self.variables) - set(assignment.keys()))
-        first_variable = unassigned[0]
+        first_variable = next(v for v in self.variables if v not in assignment)
         for value in self.domains[first_variable]:
             local_assignment = assignment.copy()
             local_assignment[first_variable] = value
-            self.report(interval)
+            self.counter = self.counter + 1
+            if self.counter >= self.next_report:
+                self.report(interval)
             if self.is_variable_consistent(first_variable, local_assignment):
-                result = self.search_for_solution(local_assignment)
+                result = self._search_copying(local_assignment, interval)
                 if result is not None:
                     return result
+        if self.stats is not None:
+            self.stats.record_backtrack(len(assignment) + 1)
+        return None
+
+    def search_in_place(self, assignment={}, interval=None, propagate=None, var_order=None, val_order=None,
+                        backjump=False):
+        """ searches for a solution the same way as search_for_solution, but all the nodes share one
+        assignment dict that is changed in place.  Each assigned variable is pushed onto an undo trail,
+        and on backtrack the trail is unwound back to the mark taken before the value was tried.
+        The unassigned variables are kept on a stack that is popped when a variable is picked and pushed
+        back when its values are exhausted, so no per-node copies or set differences are needed.
+
+        propagate selects how the live domains of the unassigned variables are pruned after each assignment:
+        None does no pruning, FORWARD_CHECKING prunes the last unassigned variable of each constraint of the
+        assigned variable, and ARC_CONSISTENCY makes the domains arc consistent with AC-3 both before the
+        search starts and after every assignment.  Pruned domains are recorded on the undo trail as well,
+        so they are restored on backtrack.
+
+        var_order selects which variable is assigned next: None takes them in the order of self.variables,
+        and MINIMUM_REMAINING_VALUES, DEGREE and DOM_WDEG pick the best variable by that heuristic, breaking
+        ties by the order of self.variables.  val_order selects the order the values of the variable are
+        tried in: None keeps the order of its domain and LEAST_CONSTRAINING_VALUE tries first the values that
+        rule out the fewest values of its neighbours.  Either may also be a function, see select_variable
+        and order_values.
+
+        With backjump=True a dead end is not simply backed up from one level at a time.  Each variable keeps a
+        conflict set, the earlier variables whose values ruled out its values through the constraints that
+        failed, and once its values run out the search jumps straight back to the latest variable of that set,
+        skipping the levels in between, whose values played no part in the failure (Prosser's conflict-directed
+        backjumping).  The values of the conflict set are also recorded as a nogood in a NogoodStore, so when
+        the same values come round again, under a different assignment of the levels skipped, they are
+        rejected at once rather than searched again.  The store is kept in self.nogoods for the next
+        backjumping search, as the nogoods stay true until a constraint is removed.  Backjumping needs to
+        know which variables caused each failure, so it cannot be combined with propagate.
+        """
+        if backjump and propagate is not None:
+            raise ValueError('backjumping cannot be combined with propagation')
+        state = self._start_in_place(assignment, interval, propagate, var_order, val_order)
+        return self._solve_in_place(state, backjump)
+
+    def _solve_in_place(self, state, backjump):
+        if state is None:
+            return None
+        if backjump:
+            if self.nogoods is None:
+                self.nogoods = NogoodStore(NOGOOD_LIMIT)
+            state.nogoods = self.nogoods
+            found = self._backjump_in_place(state) is True
+        else:
+            found = self._search_in_place(state)
+        if found:
+            self._found_solution()
+            return state.assignment
         return None
 
+    def _start_in_place(self, assignment, interval, propagate, var_order, val_order, domains=None):
+        """ returns the SearchState for an in-place search starting from assignment, with the domains already
+        propagated if propagate is set, or None if that propagation leaves some variable without a value.
+        domains, if given, are domains that have already been propagated and are used as they are.
+        """
+        self.start_reporting(interval)
+        local_assignment = dict(assignment)
+        unassigned = [v for v in reversed(self.variables) if v not in local_assignment]
+        state = SearchState(local_assignment, dict(domains if domains is not None else self.domains), unassigned,
+                            interval, propagate, var_order, val_order)
+        if propagate is not None and domains is None:
+            for v in local_assignment:
+                state.domains[v] = [local_assignment[v]]
+            if propagate == ARC_CONSISTENCY:
+                arcs = [(c, v) for c in self.constraints if c.var_list for v in c.var_list if v not in local_assignment]
+                if not self._ac3(arcs, state):
+                    return None
+            else:
+                for v in list(local_assignment):
+                    if not self._forward_check(v, state):
+                        return None
+        return state
+
+    def iter_solutions(self, assignment={}, limit=None, interval=None, propagate=None, var_order=None,
+                       val_order=None):
+        """ yields every solution that extends the assignment provided, one at a time, each as a dict of its own.
+        At most limit solutions are yielded if a limit is given.  The search is the in-place search of
+        search_in_place and takes the same propagate, var_order and val_order options; it only goes on to
+        the next solution when the caller asks for it.
+        """
+        state = self._start_in_place(assignment, interval, propagate, var_order, val_order)
+        if state is None:
+            return
+        solutions = self._iter_in_place(state)
+        if limit is not None:
+            solutions = itertools.islice(solutions, limit)
+        yield from solutions
+
+    def _iter_in_place(self, state):
+        if not state.unassigned:
+            self._found_solution()
+            yield dict(state.assignment)
+            return
+        assignment = state.assignment
+        trail = state.trail
+        variable = self.select_variable(state)
+        for value in self.order_values(variable, state):
+            mark = len(trail)
+            assignment[variable] = value
+            trail.append((variable, None))
+            self.counter = self.counter + 1
+            if self.counter >= self.next_report:
+                self.report(state.interval)
+            if self._is_consistent(variable, state) and self._propagate(variable, state):
+                yield from self._iter_in_place(state)
+            self._undo(state, mark)
+        state.unassigned.append(variable)
+        if self.stats is not None:
+            self.stats.record_backtrack(len(self.variables) - len(state.unassigned) + 1)
+
+    def count_solutions(self, interval=None, propagate=None, var_order=None, val_order=None):
+        """ returns the number of solutions, without building a dict for any of them.
+        Without global constraints the sub-problems (see sub_problems) are independent, so each one is counted
+        on its own and the counts are multiplied, rather than enumerating the combinations of their solutions.
+        The options are those of search_in_place, and are used for counting each sub-problem.
+        Each sub-problem carries on the node count, the statistics and the listeners of this CSP, so an
+        instrumented count reports its progress and backtracks as a single search would.
+        """
+        if self.global_constraints():
+            return self._count_from_start(interval, propagate, var_order, val_order)
+        count = 1
+        for sub in self.sub_problems():
+            sub.counter = self.counter
+            sub.listeners = self.listeners
+            if self.stats is not None:
+                sub.stats = self.stats
+                self.stats.csp = sub
+            try:
+                count = count * sub._count_from_start(interval, propagate, var_order, val_order)
+            finally:
+                if self.stats is not None:
+                    self.stats.csp = self
+            self.counter = sub.counter
+            self.pruned = self.pruned + sub.pruned
+            if count == 0:
+                break
+        return count
+
+    def _count_from_start(self, interval, propagate, var_order, val_order):
+        state = self._start_in_place({}, interval, propagate, var_order, val_order)
+        if state is None:
+            return 0
+        return self._count_in_place(state)
+
+    def _count_in_place(self, state):
+        if not state.unassigned:
+            return 1
+        assignment = state.assignment
+        trail = state.trail
+        count = 0
+        variable = self.select_variable(state)
+        for value in self.order_values(variable, state):
+            mark = len(trail)
+            assignment[variable] = value
+            trail.append((variable, None))
+            self.counter = self.counter + 1
+            if self.counter >= self.next_report:
+                self.report(state.interval)
+            if self._is_consistent(variable, state) and self._propagate(variable, state):
+                count = count + self._count_in_place(state)
+            self._undo(state, mark)
+        state.unassigned.append(variable)
+        if self.stats is not None:
+            self.stats.record_backtrack(len(self.variables) - len(state.unassigned) + 1)
+        return count
+
+    def _search_in_place(self, state):
+        if not state.unassigned:
+            return True
+        assignment = state.assignment
+        trail = state.trail
+        variable = self.select_variable(state)
+        for value in self.order_values(variable, state):
+            mark = len(trail)
+            assignment[variable] = value
+            trail.append((variable, None))
+            self.counter = self.counter + 1
+            if self.counter >= self.next_report:
+                self.report(state.interval)
+            if self._is_consistent(variable, state) and self._propagate(variable, state):
+                if self._search_in_place(state):
+                    return True
+            self._undo(state, mark)
+        state.unassigned.append(variable)
+        if self.stats is not None:
+            self.stats.record_backtrack(len(self.variables) - len(state.unassigned) + 1)
+        return False
+
+    def _backjump_in_place(self, state):
+        """ searches like _search_in_place, but returns True on a solution and otherwise the conflict set of the
+        dead end, the assigned variables that are to blame for it.  A conflict set that does not hold the
+        variable picked here is passed straight up, jumping over this level.
+        """
+        if not state.unassigned:
+            return True
+        assignment = state.assignment
+        trail = state.trail
+        nogoods = state.nogoods
+        conflicts = set()
+        variable = self.select_variable(state)
+        for value in self.order_values(variable, state):
+            mark = len(trail)
+            assignment[variable] = value
+            trail.append((variable, None))
+            self.counter = self.counter + 1
+            if self.counter >= self.next_report:
+                self.report(state.interval)
+            culprits = self._conflict_set(variable, state)
+            if culprits is None:
+                result = self._backjump_in_place(state)
+                if result is True:
+                    return True
+                if variable not in result:
+                    self._undo(state, mark)
+                    state.unassigned.append(variable)
+                    return result
+                culprits = result
+            conflicts.update(culprits)
+            self._undo(state, mark)
+        conflicts.discard(variable)
+        nogoods.add([(v, value) for (v, value) in assignment.items() if v in conflicts])
+        state.unassigned.append(variable)
+        if self.stats is not None:
+            self.stats.record_backtrack(len(self.variables) - len(state.unassigned) + 1)
+        return conflicts
+
+    def _conflict_set(self, variable, state):
+        """ returns None if the value just given to variable is consistent and no stored nogood rules it out,
+        and otherwise the variables whose values, together with that of variable, rule it out
+        """
+        assignment = state.assignment
+        nogood = state.nogoods.find(variable, assignment)
+        if nogood is not None:
+            return [v for (v, _) in nogood]
+        constraint = self.failed_constraint(variable, assignment)
+        if constraint is None:
+            return None
+        if state.var_order == DOM_WDEG:
+            self.weights[constraint] = self.weights.get(constraint, 1) + 1
+        if constraint.var_list:
+            return [v for v in constraint.var_list if v in assignment]
+        return list(assignment)
+
+    def search_iterative(self, assignment={}, interval=None, propagate=None, var_order=None, val_order=None,
+                         checkpoint=None, checkpoint_interval=100000, resume=False):
+        """ searches for a solution the same way as search_in_place, visiting the same nodes in the same order,
+        but keeps the path from the root on an explicit stack rather than recursing once per variable, so the
+        number of variables is not bound by the recursion limit.
+
+        Each level of the stack holds the variable picked there, the values it is tried with in order and the
+        index of the next one; every level but the last is at the value before that index.
+
+        If checkpoint is the path of a file, that stack is written to it every checkpoint_interval nodes, and
+        also when the search is interrupted by an exception such as KeyboardInterrupt.  With resume=True the
+        search carries on from the stack in the checkpoint file, if there is one, instead of starting over; it
+        must be given the same assignment and options as the search that wrote it.  The domains are not stored:
+        they are rebuilt by replaying the values on the stack with the same propagation.  The file is removed
+        once the search finishes.
+        """
+        state = self._start_in_place(assignment, interval, propagate, var_order, val_order)
+        if state is None:
+            return None
+        stack = []
+        descend = True
+        if resume and checkpoint is not None and os.path.exists(checkpoint):
+            descend = self._restore_checkpoint(checkpoint, stack, state)
+            self.start_reporting(interval)
+        assignment = state.assignment
+        trail = state.trail
+        nodes = 0
+        try:
+            while True:
+                if descend:
+                    if not state.unassigned:
+                        break
+                    variable = self.select_variable(state)
+                    stack.append([variable, list(self.order_values(variable, state)), 0, len(trail)])
+                frame = stack[-1]
+                variable, values, index, mark = frame
+                descend = False
+                self._undo(state, mark)
+                while frame[2] < len(values):
+                    assignment[variable] = values[frame[2]]
+                    trail.append((variable, None))
+                    self.counter = self.counter + 1
+                    if self.counter >= self.next_report:
+                        self.report(interval)
+                    nodes = nodes + 1
+                    consistent = self._is_consistent(variable, state) and self._propagate(variable, state)
+                    frame[2] = frame[2] + 1
+                    if consistent:
+                        descend = True
+                        break
+                    self._undo(state, mark)
+                if not descend:
+                    stack.pop()
+                    state.unassigned.append(variable)
+                    if self.stats is not None:
+                        self.stats.record_backtrack(len(self.variables) - len(state.unassigned) + 1)
+                    if not stack:
+                        break
+                if checkpoint is not None and nodes >= checkpoint_interval:
+                    self._save_checkpoint(checkpoint, stack, descend)
+                    nodes = 0
+        except BaseException:
+            if checkpoint is not None and stack:
+                self._save_checkpoint(checkpoint, stack, descend)
+            raise
+        if checkpoint is not None and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        if descend:
+            self._found_solution()
+            return assignment
+        return None
+
+    def _save_checkpoint(self, path, stack, descend):
+        """ writes the stack of search_iterative to path as JSON, with variables given by their position in
+        self.variables and values by their position in the domain of their variable.  The dom/wdeg weights
+        are written as well, keyed by the position of their constraint in self.constraints.
+        """
+        levels = []
+        for (variable, values, index, mark) in stack:
+            domain = self.domains[variable]
+            levels.append([self.position[variable], [domain.index(value) for value in values], index])
+        position = {c: i for (i, c) in enumerate(self.constraints)}
+        data = {
+            'variables': len(self.variables),
+            'levels': levels,
+            'descend': descend,
+            'nodes': self.counter,
+            'weights': [[position[c], w] for (c, w) in self.weights.items() if c in position],
+        }
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(temporary, path)
+
+    def _restore_checkpoint(self, path, stack, state):
+        """ rebuilds the stack and the search state written by _save_checkpoint by assigning, level by level,
+        the value each level was at and propagating it.  Unless the search was about to descend, the last level
+        is left unassigned, and the search goes on with the value at its index.
+        Returns whether the search goes on by descending.
+        """
+        with open(path) as f:
+            data = json.load(f)
+        if data['variables'] != len(self.variables):
+            raise ValueError('checkpoint {} is for a CSP with {} variables, not {}'.format(
+                path, data['variables'], len(self.variables)))
+        levels = data['levels']
+        for (depth, (position, value_indices, index)) in enumerate(levels):
+            variable = self.variables[position]
+            domain = self.domains[variable]
+            values = [domain[k] for k in value_indices]
+            state.unassigned.remove(variable)
+            mark = len(state.trail)
+            stack.append([variable, values, index, mark])
+            if depth == len(levels) - 1 and not data['descend']:
+                break
+            state.assignment[variable] = values[index - 1]
+            state.trail.append((variable, None))
+            if not (self._is_consistent(variable, state) and self._propagate(variable, state)):
+                raise ValueError('checkpoint {} does not match the CSP it is resumed on'.format(path))
+        self.counter = data['nodes']
+        self.weights = {self.constraints[i]: w for (i, w) in data['weights']}
+        return data['descend']
+
+    def _is_consistent(self, variable, state):
+        if state.var_order != DOM_WDEG:
+            return self.is_variable_consistent(variable, state.assignment)
+        constraint = self.failed_constraint(variable, state.assignment)
+        if constraint is None:
+            return True
+        self.weights[constraint] = self.weights.get(constraint, 1) + 1
+        return False
+
+    def select_variable(self, state):
+        """ removes the next variable to assign from state.unassigned and returns it.
+        If state.var_order is a function it is called as var_order(csp, state) and must return one of the
+        variables in state.unassigned.
+        """
+        unassigned = state.unassigned
+        order = state.var_order
+        if order is None:
+            return unassigned.pop()
+        if callable(order):
+            index = unassigned.index(order(self, state))
+        else:
+            key = self._variable_keys[order]
+            index = min(range(len(unassigned)), key=lambda i: key(self, unassigned[i], state))
+        unassigned[index], unassigned[-1] = unassigned[-1], unassigned[index]
+        return unassigned.pop()
+
+    def order_values(self, variable, state):
+        """ returns the values of the live domain of variable in the order they should be tried.
+        If state.val_order is a function it is called as val_order(csp, variable, state).
+        """
+        order = state.val_order
+        if order is None:
+            return state.domains[variable]
+        if callable(order):
+            return order(self, variable, state)
+        return sorted(state.domains[variable], key=lambda value: self.values_ruled_out(variable, value, state))
+
+    def degree(self, variable, state):
+        """ the number of constraints on variable that also involve some other unassigned variable """
+        assignment = state.assignment
+        count = 0
+        for c in self.constraints_for_variable[variable]:
+            if c.var_list and any(v != variable and v not in assignment for v in c.var_list):
+                count = count + 1
+        return count
+
+    def weighted_degree(self, variable, state):
+        """ like degree, but each constraint counts its weight, which is one plus the number of times it failed """
+        assignment = state.assignment
+        total = 0
+        for c in self.constraints_for_variable[variable]:
+            if c.var_list and any(v != variable and v not in assignment for v in c.var_list):
+                total = total + self.weights.get(c, 1)
+        return total
+
+    def values_ruled_out(self, variable, value, state):
+        """ counts the values of the neighbours of variable that assigning it value would rule out, looking at
+        the constraints on variable that would be left with a single unassigned variable
+        """
+        assignment = state.assignment
+        assignment[variable] = value
+        count = 0
+        for c in self.constraints_for_variable[variable]:
+            if not c.var_list:
+                continue
+            unassigned = [v for v in c.var_list if v not in assignment]
+            if len(unassigned) != 1:
+                continue
+            neighbour = unassigned[0]
+            trial = {v: assignment[v] for v in c.var_list if v != neighbour}
+            for x in state.domains[neighbour]:
+                trial[neighbour] = x
+                if not c.constraint_fn(trial):
+                    count = count + 1
+        del assignment[variable]
+        return count
+
+    def _undo(self, state, mark):
+        """ unwinds the undo trail back to mark, removing the assignments and restoring the domains changed
+        since the mark was taken.  An entry (var, None) records an assignment, and (var, old_domain) records
+        that the domain of var was replaced.
+        """
+        trail = state.trail
+        while len(trail) > mark:
+            var, old_domain = trail.pop()
+            if old_domain is None:
+                del state.assignment[var]
+            else:
+                state.domains[var] = old_domain
+
+    def _propagate(self, variable, state):
+        if state.propagate is None:
+            return True
+        if state.propagate == FORWARD_CHECKING:
+            return self._forward_check(variable, state)
+        arcs = [(c, v) for c in self.constraints_for_variable[variable] if c.var_list
+                for v in c.var_list if v not in state.assignment]
+        return self._ac3(arcs, state)
+
+    def _forward_check(self, variable, state):
+        """ for each constraint on variable that now has exactly one unassigned variable, removes the values of
+        that variable which would violate the constraint.  Constraints with prunes_early set, such as
+        AllDifferent, have all their unassigned variables checked against the value just given to variable
+        instead (see Constraint.forward_check), or revised if they have no such check.
+        Returns False if a domain becomes empty.
+        """
+        value = state.assignment[variable]
+        domains = state.domains
+        for c in self.constraints_for_variable[variable]:
+            if not c.var_list:
+                continue
+            unassigned = [v for v in c.var_list if v not in state.assignment]
+            if c.prunes_early:
+                for v in unassigned:
+                    kept = c.forward_check(v, domains[v], variable, value)
+                    if kept is None:
+                        if not self._revise(c, v, state):
+                            return False
+                    elif not self._narrow(c, v, kept, state):
+                        return False
+            elif len(unassigned) == 1:
+                if not self._revise(c, unassigned[0], state):
+                    return False
+        return True
+
+    def make_arc_consistent(self, domains=None):
+        """ runs AC-3 over every constraint with a var_list and returns the pruned domains, or None if some
+        variable is left without any value.  The domains provided are not changed.
+        """
+        domains = dict(domains if domains is not None else self.domains)
+        arcs = [(c, v) for c in self.constraints if c.var_list for v in c.var_list]
+        if self._ac3(arcs, SearchState({}, domains, [])):
+            return domains
+        return None
+
+    def _ac3(self, arcs, state):
+        """ revises each arc (constraint, var) on the queue, and whenever the domain of var shrinks puts back
+        on the queue the arcs of the other unassigned variables of the constraints on var.  That includes the
+        constraint just revised unless it is binary, as the bounds reasoning of a propagator like LinearEq's
+        can narrow its other variables further once var has shrunk.  A constraint with prunes_early set is
+        revised on all its unassigned variables at once (see _revise_all), which leaves nothing more for it to
+        remove, so its other arcs are taken off the queue and it is not put back for the variables it narrowed.
+        Returns False as soon as a domain becomes empty.
+        """
+        domains = state.domains
+        queue = list(arcs)
+        queued = set(queue)
+        while queue:
+            arc = queue.pop()
+            if arc not in queued:
+                continue
+            queued.discard(arc)
+            constraint, var = arc
+            if constraint.prunes_early:
+                unassigned = [v for v in constraint.var_list if v not in state.assignment]
+                for v in unassigned:
+                    queued.discard((constraint, v))
+                changed = self._revise_all(constraint, unassigned, state)
+                if changed is None:
+                    return False
+            else:
+                size = len(domains[var])
+                if not self._revise(constraint, var, state):
+                    return False
+                if len(domains[var]) == size:
+                    continue
+                changed = [var]
+            for w in changed:
+                for c in self.constraints_for_variable[w]:
+                    if not c.var_list or (c is constraint and (len(c.var_list) == 2 or c.prunes_early)):
+                        continue
+                    for v in c.var_list:
+                        if v != w and v not in state.assignment and (c, v) not in queued:
+                            queue.append((c, v))
+                            queued.add((c, v))
+        return True
+
+    def _revise_all(self, constraint, variables, state):
+        """ revises every variable of variables, the unassigned variables of constraint, with a single call to
+        its propagator for all of its variables (see Constraint.revise_all), so that a propagator like Régin's
+        for AllDifferent finds its matching once rather than once per variable.  A constraint without one has
+        each variable revised on its own, over and over until none of their domains shrinks.
+        Returns the variables whose domains shrank, or None if a domain becomes empty.
+        """
+        assignment = state.assignment
+        domains = state.domains
+        kept_of = constraint.revise_all(
+            {v: [assignment[v]] if v in assignment else domains[v] for v in constraint.var_list})
+        changed = []
+        if kept_of is not None:
+            for v in variables:
+                size = len(domains[v])
+                if not self._narrow(constraint, v, kept_of[v], state):
+                    return None
+                if len(domains[v]) < size:
+                    changed.append(v)
+            return changed
+        shrinking = True
+        while shrinking:
+            shrinking = False
+            for v in variables:
+                size = len(domains[v])
+                if not self._revise(constraint, v, state):
+                    return None
+                if len(domains[v]) < size:
+                    shrinking = True
+                    if v not in changed:
+                        changed.append(v)
+        return changed
+
+    def _revise(self, constraint, var, state):
+        """ removes from the domain of var the values that have no support in constraint, that is no combination
+        of values of the other variables of the constraint that satisfies it.  Constraints with a propagator of
+        their own (see Constraint.revise) narrow the domain directly; for the others every combination is tried,
+        and the last support found for each value is remembered, as in AC-2001, and tried first the next time
+        the value is revised.
+        Returns False if the domain of var becomes empty.
+        """
+        assignment = state.assignment
+        domains = state.domains
+        others = [v for v in constraint.var_list if v != var]
+        candidates = [[assignment[v]] if v in assignment else domains[v] for v in others]
+        kept = constraint.revise(var, domains[var], dict(zip(others, candidates)))
+        if kept is None:
+            kept = self._revise_by_enumeration(constraint, var, candidates, others, domains[var])
+        return self._narrow(constraint, var, kept, state)
+
+    def _narrow(self, constraint, var, kept, state):
+        """ replaces the domain of var by kept, the values constraint left it, recording the change on the undo
+        trail.  Returns False if kept is empty.
+        """
+        domains = state.domains
+        if len(kept) < len(domains[var]):
+            self.pruned = self.pruned + len(domains[var]) - len(kept)
+            if self.stats is not None:
+                self.stats.record_pruning(constraint, len(domains[var]) - len(kept))
+            state.trail.append((var, domains[var]))
+            domains[var] = kept
+        if kept:
+            return True
+        if state.var_order == DOM_WDEG:
+            self.weights[constraint] = self.weights.get(constraint, 1) + 1
+        return False
+
+    def _revise_by_enumeration(self, constraint, var, candidates, others, domain):
+        kept = []
+        for value in domain:
+            key = (constraint, var, value)
+            support = self._supports.get(key)
+            if support is not None and all(s in c for (s, c) in zip(support, candidates)):
+                kept.append(value)
+                continue
+            trial = {var: value}
+            for combination in itertools.product(*candidates):
+                trial.update(zip(others, combination))
+                if constraint.constraint_fn(trial):
+                    self._supports[key] = combination
+                    kept.append(value)
+                    break
+        return kept
+
+    def instrument(self, listener=None):
+        """ turns on the collection of statistics and returns the SearchStats they are collected in.
+        If listener is given it is added to the listeners, which are called as listener(event, stats) with
+        event 'progress' every interval nodes of a search (REPORT_INTERVAL when no interval is given) and with
+        event 'solution' whenever a search finds a solution.
+        Without instrument, the searches only count nodes in self.counter and keep no other statistics.
+        """
+        if self.stats is None:
+            self.stats = SearchStats(self)
+        if listener is not None:
+            self.listeners.append(listener)
+        return self.stats
+
+    def uninstrument(self):
+        self.stats = None
+        self.listeners = []
+
+    def start_reporting(self, interval=None):
+        """ called when a search starts, to have report called after the next interval nodes """
+        self.next_report = self.counter + (interval or self.REPORT_INTERVAL)
+
     def report(self, interval=None):
-        # report_interval = interval if interval else self.REPORT_INTERVAL  
-        self.counter = self.counter + 1
-        if self.counter % 50000 == 0:
-            print(self.counter)
+        """ called by the searches once every interval nodes, or every REPORT_INTERVAL nodes if no interval is
+        given, rather than at every node.  Sends a 'progress' event to the listeners.
+        """
+        self.start_reporting(interval)
+        self._emit('progress')
+
+    def _found_solution(self):
+        if self.stats is not None:
+            self.stats.solutions = self.stats.solutions + 1
+            self.stats.max_depth = len(self.variables)
+        self._emit('solution')
+
+    def _emit(self, event):
+        for listener in self.listeners:
+            listener(event, self.stats)
+
+class SearchState:
+    """ holds what is shared by all the nodes of one in-place search: the assignment, the live domains of the
+    variables, the undo trail, the stack of unassigned variables and the options the search was started with
+    """
+    __slots__ = ('assignment', 'domains', 'unassigned', 'trail', 'interval', 'propagate', 'var_order', 'val_order',
+                 'nogoods')
+
+    def __init__(self, assignment, domains, unassigned, interval=None, propagate=None, var_order=None,
+                 val_order=None):
+        self.assignment = assignment
+        self.domains = domains
+        self.unassigned = unassigned
+        self.trail = []
+        self.interval = interval
+        self.propagate = propagate
+        self.var_order = var_order
+        self.val_order = val_order
+        self.nogoods = None
+
+class NogoodStore:
+    """ the nogoods learned by a backjumping search, each a frozenset of (variable, value) pairs that no solution
+    can hold all of.  At most limit are kept: when a new one would go over, the least recently used is dropped,
+    a nogood counting as used when it is learned and whenever it rules out a value.  Nogoods of more than
+    size_limit pairs are not kept at all, as they seldom rule anything out and cost as much to watch.
+
+    Each nogood watches two of its pairs, as clauses do in a SAT solver.  When a watched pair comes to hold,
+    find moves the watch to another pair that does not hold; only when there is none, and the other watched
+    pair holds too, has the nogood ruled the value out.  Backtracking only makes pairs stop holding, so the
+    watches stay valid without being moved back, and find looks at a few nogoods rather than at all of those
+    that hold the value just assigned.  A watch that goes stale because the assignment was changed without
+    find being told only means a nogood is missed, never that a value is wrongly ruled out.
+    """
+    __slots__ = ('limit', 'size_limit', 'nogoods', 'watches', 'hits')
+
+    def __init__(self, limit=NOGOOD_LIMIT, size_limit=NOGOOD_SIZE_LIMIT):
+        self.limit = limit
+        self.size_limit = size_limit
+        # each nogood maps to the list of the pairs it watches, and each pair to the nogoods that watch it
+        self.nogoods = OrderedDict()
+        self.watches = {}
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.nogoods)
+
+    def add(self, pairs):
+        """ adds the nogood of pairs, given in the order their variables were assigned.  The last two are
+        watched, as backjumping undoes them first.
+        """
+        nogood = frozenset(pairs)
+        if not nogood or len(nogood) > self.size_limit:
+            return
+        if nogood in self.nogoods:
+            self.nogoods.move_to_end(nogood)
+            return
+        watched = list(dict.fromkeys(pairs))[-2:]
+        self.nogoods[nogood] = watched
+        for pair in watched:
+            self.watches.setdefault(pair, {})[nogood] = None
+        if len(self.nogoods) > self.limit:
+            evicted, watched = self.nogoods.popitem(last=False)
+            for pair in watched:
+                del self.watches[pair][evicted]
+
+    def find(self, variable, assignment):
+        """ returns a nogood that holds the value of variable in assignment and whose other pairs all hold in
+        assignment as well, or None if there is none
+        """
+        pair = (variable, assignment[variable])
+        watching = self.watches.get(pair)
+        if not watching:
+            return None
+        for nogood in list(watching):
+            watched = self.nogoods[nogood]
+            if len(watched) == 1:
+                other = None
+            else:
+                other = watched[1] if watched[0] == pair else watched[0]
+            for p in nogood:
+                if p != pair and p != other and not (p[0] in assignment and assignment[p[0]] == p[1]):
+                    del watching[nogood]
+                    watched[watched.index(pair)] = p
+                    self.watches.setdefault(p, {})[nogood] = None
+                    break
+            else:
+                if other is None or (other[0] in assignment and assignment[other[0]] == other[1]):
+                    self.nogoods.move_to_end(nogood)
+                    self.hits = self.hits + 1
+                    return nogood
+        return None
+
+class SearchStats:
+    """ the statistics of the searches run on a CSP since it was instrumented (see CSP.instrument):
+    the nodes visited, the backtracks, the deepest level reached, the solutions found, for each constraint the
+    number of times it was checked and the time spent checking it, and for each type of propagator the number of
+    values it pruned
+    """
+    __slots__ = ('csp', 'first_node', 'started', 'backtracks', 'max_depth', 'solutions', 'checks', 'check_time',
+                 'pruned')
+
+    def __init__(self, csp):
+        self.csp = csp
+        self.first_node = csp.counter
+        self.started = time.perf_counter()
+        self.backtracks = 0
+        self.max_depth = 0
+        self.solutions = 0
+        self.checks = {}
+        self.check_time = {}
+        self.pruned = {}
+
+    @property
+    def nodes(self):
+        return self.csp.counter - self.first_node
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def nodes_per_second(self):
+        seconds = self.seconds
+        return self.nodes / seconds if seconds else 0.0
+
+    def record_backtrack(self, depth):
+        """ records that the values of the variable at depth (the root being depth 1) ran out """
+        self.backtracks = self.backtracks + 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def record_check(self, constraint, seconds):
+        self.checks[constraint] = self.checks.get(constraint, 0) + 1
+        self.check_time[constraint] = self.check_time.get(constraint, 0.0) + seconds
+
+    def record_pruning(self, constraint, count):
+        propagator = type(constraint).__name__
+        self.pruned[propagator] = self.pruned.get(propagator, 0) + count
+
+    def as_dict(self):
+        """ returns the statistics as a dict of plain values, ready to be sent on as JSON.  Constraints are
+        named by their position in csp.constraints and their type, e.g. '3:LinearEq'.
+        """
+        position = {c: i for (i, c) in enumerate(self.csp.constraints)}
+
+        def name(c):
+            return '{}:{}'.format(position.get(c, '?'), type(c).__name__)
+
+        return {
+            'nodes': self.nodes,
+            'backtracks': self.backtracks,
+            'max_depth': self.max_depth,
+            'solutions': self.solutions,
+            'seconds': self.seconds,
+            'nodes_per_second': self.nodes_per_second,
+            'constraint_checks': {name(c): n for (c, n) in self.checks.items()},
+            'constraint_seconds': {name(c): t for (c, t) in self.check_time.items()},
+            'pruned': dict(self.pruned),
+        }
+
+def print_progress(event, stats):
+    """ a listener for CSP.instrument that prints the number of nodes visited so far, as report used to """
+    if event == 'progress':
+        print(stats.nodes)
 
 class Constraint:
+    __slots__ = ('var_list', 'constraint_fn')
+    prunes_early = False
+
     def __init__(self, constraint_fn, var_list=None):
         self.var_list = var_list
         self.constraint_fn = constraint_fn
@@ -150,3 +1496,374 @@ class Constraint:
         else:
             return self.constraint_fn(assignment)
 
+    def is_satisfied_after(self, var, assignment):
+        """ tests the constraint just after var has been assigned, when it already held before that.  The
+        searches check the constraints with prunes_early set this way as they assign each variable, which lets
+        them look only at the value of var rather than at every assigned variable.
+        """
+        return self.is_satisfied(assignment)
+
+    def check(self, values):
+        """ tests the constraint on the values of its var_list, given in the same order """
+        return self.constraint_fn(dict(zip(self.var_list, values)))
+
+    def revise(self, var, domain, candidates):
+        """ the propagator of the constraint: returns the values of domain, the live domain of var, that can
+        still satisfy the constraint given candidates, which maps each of the other variables of the var_list
+        to its live domain.  A constraint with no propagator of its own returns None, and CSP._revise then
+        finds the supported values by trying every combination.
+        """
+        return None
+
+    def forward_check(self, var, domain, variable, value):
+        """ the check forward checking makes of a constraint with prunes_early set: returns the values of domain,
+        the live domain of var, that are still allowed now that variable has been given value, looking at that
+        value alone.  A constraint with no such check returns None, and var is revised instead.
+        """
+        return None
+
+    def revise_all(self, domains):
+        """ the propagator of the constraint for all of its variables at once: domains maps each variable of
+        the var_list to its live domain, and the result maps each of them to the values of its domain that can
+        still satisfy the constraint.  A constraint that has no such propagator returns None, and its variables
+        are then revised one at a time.
+        """
+        return None
+
+class LinearEq(Constraint):
+    """ the constraint coeffs[0] * var_list[0] + coeffs[1] * var_list[1] + ... == rhs """
+    __slots__ = ('coeffs', 'rhs')
+
+    def __init__(self, coeffs, var_list, rhs):
+        super().__init__(self._holds, list(var_list))
+        self.coeffs = tuple(coeffs)
+        self.rhs = rhs
+
+    def _holds(self, assignment):
+        return self.check([assignment[v] for v in self.var_list])
+
+    def check(self, values):
+        total = 0
+        for (c, x) in zip(self.coeffs, values):
+            total = total + c * x
+        return total == self.rhs
+
+    def revise(self, var, domain, candidates):
+        """ bounds consistency: c * var must lie between rhs minus the largest and rhs minus the smallest sum
+        the other terms can reach.  With just one other variable that is not enough to be exact, so each value
+        is instead checked for the one value of the other variable that it needs.  That takes an exact division,
+        so when some of the numbers are not integers None is returned and the supports are found by trying
+        every value instead.  When the other variable has a zero coefficient the bounds are exact already.
+        """
+        coeff = None
+        low = high = 0
+        for (c, v) in zip(self.coeffs, self.var_list):
+            if v == var:
+                coeff = c
+                continue
+            values = candidates[v]
+            if not values:
+                return []
+            a = c * min(values)
+            b = c * max(values)
+            low = low + min(a, b)
+            high = high + max(a, b)
+        if len(candidates) == 1:
+            ((other, values),) = candidates.items()
+            c = self.coeffs[self.var_list.index(other)]
+            if c != 0:
+                numbers = itertools.chain(domain, values, (coeff, c, self.rhs))
+                if not all(isinstance(x, int) for x in numbers):
+                    return None
+                allowed = set(values)
+                kept = []
+                for x in domain:
+                    rest = self.rhs - coeff * x
+                    if rest % c == 0 and rest // c in allowed:
+                        kept.append(x)
+                return kept
+        return [x for x in domain if self.rhs - high <= coeff * x <= self.rhs - low]
+
+class Offset(LinearEq):
+    """ the constraint a == b + k """
+    __slots__ = ()
+
+    def __init__(self, a, b, k):
+        super().__init__((1, -1), [a, b], k)
+
+class Ratio(LinearEq):
+    """ the constraint a == b * num / den, kept in whole numbers as a * den == b * num """
+    __slots__ = ()
+
+    def __init__(self, a, b, num, den):
+        super().__init__((den, -num), [a, b], 0)
+
+class LessThan(Constraint):
+    """ the constraint a < b """
+    __slots__ = ()
+
+    def __init__(self, a, b):
+        super().__init__(self._holds, [a, b])
+
+    def _holds(self, assignment):
+        return assignment[self.var_list[0]] < assignment[self.var_list[1]]
+
+    def check(self, values):
+        return values[0] < values[1]
+
+    def revise(self, var, domain, candidates):
+        a, b = self.var_list
+        if var == a:
+            if not candidates[b]:
+                return []
+            bound = max(candidates[b])
+            return [x for x in domain if x < bound]
+        if not candidates[a]:
+            return []
+        bound = min(candidates[a])
+        return [x for x in domain if x > bound]
+
+class AllDifferent(Constraint):
+    """ the constraint that the variables of var_list all take different values """
+    __slots__ = ('seen', 'owner')
+    prunes_early = True
+
+    def __init__(self, var_list):
+        super().__init__(self._holds, list(var_list))
+        # the assignment is_satisfied_after last ran on, and the variable it last found holding each value
+        self.seen = None
+        self.owner = {}
+
+    def _holds(self, assignment):
+        return self.check([assignment[v] for v in self.var_list])
+
+    def is_satisfied(self, assignment):
+        """ unlike the other constraints this is checked before all of its variables are assigned, as two
+        assigned variables that hold the same value already violate it
+        """
+        used = set()
+        for v in self.var_list:
+            if v in assignment:
+                value = assignment[v]
+                if value in used:
+                    return False
+                used.add(value)
+        return True
+
+    def is_satisfied_after(self, var, assignment):
+        """ the searches assign and unassign the variables of a single assignment, so the variable each value was
+        last given to is remembered from one call to the next, and var only clashes with that variable, if it
+        still holds the value.  A variable that was unassigned since is found out the same way, and the owners
+        are found again with a full pass whenever the assignment is a different one.
+        """
+        value = assignment[var]
+        if self.seen is not assignment:
+            self.seen = None
+            self.owner = owner = {}
+            for v in self.var_list:
+                if v in assignment:
+                    if assignment[v] in owner:
+                        return False
+                    owner[assignment[v]] = v
+            self.seen = assignment
+            return True
+        owner = self.owner
+        other = owner.get(value)
+        if other is not None and other != var and other in assignment and assignment[other] == value:
+            return False
+        owner[value] = var
+        return True
+
+    def check(self, values):
+        return all_vals_are_different(values)
+
+    def revise(self, var, domain, candidates):
+        domains = dict(candidates)
+        domains[var] = domain
+        supported = self.supported_values(domains)
+        if supported is None:
+            return []
+        return [x for x in domain if (var, x) in supported]
+
+    def forward_check(self, var, domain, variable, value):
+        """ the values of the other variables were taken out of domain as they were assigned, so only value
+        is left to take out; the matching of revise is kept for ARC_CONSISTENCY
+        """
+        if value not in domain:
+            return domain
+        return [x for x in domain if x != value]
+
+    def revise_all(self, domains):
+        supported = self.supported_values(domains)
+        if supported is None:
+            return {v: [] for v in self.var_list}
+        return {v: [x for x in domains[v] if (v, x) in supported] for v in self.var_list}
+
+    def supported_values(self, domains):
+        """ Régin's filtering: returns the set of (variable, value) pairs that are part of some assignment of
+        different values to all of var_list from domains, or None if there is no such assignment.
+
+        A maximum matching of the variables to the values is found first.  In the graph where each matched
+        edge points from the variable to its value and every other edge from the value to the variable, an
+        unmatched pair (var, value) is supported if value can be reached from a value no variable is matched
+        to, or if var and value lie on a common cycle, that is in the same strongly connected component.
+        """
+        variables = self.var_list
+        owner = {}
+        matched = {}
+
+        def augment(v):
+            # a depth first search for an augmenting path from v, kept on an explicit stack so that the number
+            # of variables is not bound by the recursion limit: path holds the variables of the path, each with
+            # an iterator over its values, and through[i] is the value that leads from path[i] to path[i + 1]
+            visited = set()
+            path = [(v, iter(domains[v]))]
+            through = []
+            while path:
+                u, values = path[-1]
+                for x in values:
+                    if x in visited:
+                        continue
+                    visited.add(x)
+                    through.append(x)
+                    if x not in owner:
+                        for ((w, _), y) in zip(path, through):
+                            owner[y] = w
+                            matched[w] = y
+                        return True
+                    path.append((owner[x], iter(domains[owner[x]])))
+                    break
+                else:
+                    path.pop()
+                    if through:
+                        through.pop()
+            return False
+
+        for v in variables:
+            if not augment(v):
+                return None
+
+        # nodes are (0, variable) and (1, value)
+        edges = {}
+        for v in variables:
+            edges[(0, v)] = [(1, matched[v])]
+            for x in domains[v]:
+                if matched[v] != x:
+                    edges.setdefault((1, x), []).append((0, v))
+        for x in owner:
+            edges.setdefault((1, x), [])
+
+        reached = set()
+        stack = [(1, x) for v in variables for x in domains[v] if x not in owner]
+        while stack:
+            node = stack.pop()
+            if node in reached:
+                continue
+            reached.add(node)
+            stack.extend(edges.get(node, []))
+
+        component = _strongly_connected_components(edges)
+        supported = set()
+        for v in variables:
+            for x in domains[v]:
+                if matched[v] == x or (1, x) in reached or component[(1, x)] == component[(0, v)]:
+                    supported.add((v, x))
+        return supported
+
+class LookupConstraint(Constraint):
+    """ a constraint that stands in for another one, with the same var_list, checking full assignments of
+    its variables by looking their values up rather than calling the constraint_fn of the original.
+    Partial assignments and propagation are still left to the original.
+    """
+    __slots__ = ('constraint', 'prunes_early')
+
+    def __init__(self, constraint):
+        super().__init__(self._holds, constraint.var_list)
+        self.constraint = constraint
+        self.prunes_early = constraint.prunes_early
+
+    def _holds(self, assignment):
+        return self.check(tuple([assignment[v] for v in self.var_list]))
+
+    def is_satisfied(self, assignment):
+        for v in self.var_list:
+            if v not in assignment:
+                return not self.prunes_early or self.constraint.is_satisfied(assignment)
+        return self.constraint_fn(assignment)
+
+    def is_satisfied_after(self, var, assignment):
+        for v in self.var_list:
+            if v not in assignment:
+                return not self.prunes_early or self.constraint.is_satisfied_after(var, assignment)
+        return self.constraint_fn(assignment)
+
+    def revise(self, var, domain, candidates):
+        return self.constraint.revise(var, domain, candidates)
+
+    def forward_check(self, var, domain, variable, value):
+        return self.constraint.forward_check(var, domain, variable, value)
+
+    def revise_all(self, domains):
+        return self.constraint.revise_all(domains)
+
+class TableConstraint(LookupConstraint):
+    """ a constraint given by the set of the combinations of values of its var_list that satisfy it, found by
+    trying every combination of the domains provided.  Values outside those domains never satisfy it.
+    For two variables the table is also kept as a dict from each value of the first to the set of values of
+    the second it allows, which saves building a tuple for every check.
+    """
+    __slots__ = ('allowed', 'pairs')
+
+    def __init__(self, constraint, domains):
+        super().__init__(constraint)
+        self.allowed = {values for values in itertools.product(*domains) if constraint.check(values)}
+        allowed = self.allowed
+        var_list = tuple(self.var_list)
+        self.pairs = None
+        if len(var_list) == 2:
+            pairs = {}
+            for (x, y) in allowed:
+                pairs.setdefault(x, set()).add(y)
+            a, b = var_list
+            self.pairs = pairs
+            self.constraint_fn = lambda assignment: assignment[b] in pairs.get(assignment[a], ())
+        else:
+            self.constraint_fn = lambda assignment: tuple([assignment[v] for v in var_list]) in allowed
+
+    def is_satisfied(self, assignment):
+        if self.pairs is not None:
+            a, b = self.var_list
+            if a in assignment and b in assignment:
+                return assignment[b] in self.pairs.get(assignment[a], ())
+            return not self.prunes_early or self.constraint.is_satisfied(assignment)
+        for v in self.var_list:
+            if v not in assignment:
+                return not self.prunes_early or self.constraint.is_satisfied(assignment)
+        return self.constraint_fn(assignment)
+
+    def check(self, values):
+        return tuple(values) in self.allowed
+
+class CachedConstraint(LookupConstraint):
+    """ a constraint that remembers whether the last size combinations of values of its var_list it was checked
+    on satisfy it, dropping the least recently used when a new one would go over
+    """
+    __slots__ = ('size', 'cache')
+
+    def __init__(self, constraint, size=CACHE_SIZE):
+        super().__init__(constraint)
+        self.size = size
+        self.cache = OrderedDict()
+
+    def check(self, values):
+        values = tuple(values)
+        cache = self.cache
+        result = cache.get(values)
+        if result is not None:
+            cache.move_to_end(values)
+            return result
+        result = bool(self.constraint.check(values))
+        cache[values] = result
+        if len(cache) > self.size:
+            cache.popitem(last=False)
+        return result
@@ -0,0 +1,149 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+import itertools
+
+from csp import CSP
+from csp import LinearEq
+from csp import FORWARD_CHECKING
+from csp import MINIMUM_REMAINING_VALUES
+from csp_parallel import TASKS_PER_WORKER
+from csp_parallel import process_context
+
+""" batch solving of many instances of one model: CSPs that share their variables and the scopes and types of
+their constraints, and differ only in the domains of the variables and the right hand sides of their LinearEq
+constraints (which include Offset and Ratio).
+
+A BatchModel builds the CSP, and with it the index of the constraints of each variable, once.  Each instance is
+then given as a pair (domains, constants), where constants maps the position of a LinearEq in the constraints
+to its right hand side for that instance, and is loaded by swapping those into the CSP before it is searched.
+
+solve_batch takes a stream of instances and yields (index, solution) pairs, index being the position of the
+instance in the stream, as the solutions are found.  The instances are read BATCH_SIZE at a time, and each batch
+is first checked as a whole by bounds_check, which rules out the instances where some variable has no values or
+some LinearEq cannot reach its right hand side from the bounds of the domains.  Those are answered with None
+straight away, and the rest are searched, one task per batch, on a pool of worker processes that each hold a
+copy of the model.  The results come back in the order the tasks finish, not the order of the stream.
+"""
+
+BATCH_SIZE = 64
+
+# the state of a worker process, set up by the initializer of its pool
+_worker = {}
+
+
+class BatchModel:
+    """ the skeleton shared by the instances of a model: the variables, and the constraints with the right hand
+    sides of the LinearEq constraints as defaults for the instances that do not give their own
+    """
+    __slots__ = ('csp', 'linear', 'defaults')
+
+    def __init__(self, variables, constraints):
+        self.csp = CSP(variables, {v: [] for v in variables}, constraints)
+        self.linear = {i: c for (i, c) in enumerate(constraints) if isinstance(c, LinearEq)}
+        self.defaults = {i: c.rhs for (i, c) in self.linear.items()}
+
+    def load(self, domains, constants=None):
+        """ makes the CSP of the model that of the instance given by domains and constants, and returns it """
+        csp = self.csp
+        csp.forget()
+        csp.domains = domains
+        for (i, c) in self.linear.items():
+            c.rhs = self.defaults[i]
+        if constants:
+            for (i, rhs) in constants.items():
+                self.linear[i].rhs = rhs
+        return csp
+
+    def bounds_check(self, batch):
+        """ returns, for each instance (domains, constants) of batch, False if it certainly has no solution,
+        because some variable has no values or the smallest and largest sums some LinearEq can reach over the
+        domains leave out its right hand side, and True otherwise.
+        The checks are made one constraint at a time across the whole batch.
+        """
+        feasible = [all(domains[v] for v in self.csp.variables) for (domains, _) in batch]
+        for (i, c) in self.linear.items():
+            default = self.defaults[i]
+            terms = list(zip(c.coeffs, c.var_list))
+            for (k, (domains, constants)) in enumerate(batch):
+                if not feasible[k]:
+                    continue
+                rhs = constants.get(i, default) if constants else default
+                low = high = 0
+                for (coeff, v) in terms:
+                    values = domains[v]
+                    a = coeff * min(values)
+                    b = coeff * max(values)
+                    low = low + min(a, b)
+                    high = high + max(a, b)
+                feasible[k] = low <= rhs <= high
+        return feasible
+
+    def solve(self, domains, constants=None, propagate=FORWARD_CHECKING, var_order=MINIMUM_REMAINING_VALUES,
+              val_order=None):
+        """ searches for a solution of the instance, returning it as a dict of its own, or None """
+        solution = self.load(domains, constants).search_in_place({}, None, propagate, var_order, val_order)
+        return None if solution is None else dict(solution)
+
+
+def solve_batch(model, instances, workers=None, propagate=FORWARD_CHECKING, var_order=MINIMUM_REMAINING_VALUES,
+                val_order=None, batch_size=BATCH_SIZE):
+    """ yields (index, solution) for every instance (domains, constants) of the iterable instances, where
+    solution is None if the instance has none.  Without workers the instances are solved in this process, in
+    order; with workers they are solved by that many processes, keeping at most TASKS_PER_WORKER batches per
+    worker in flight so that instances are only read from the stream as they are needed.
+    """
+    options = (propagate, var_order, val_order)
+    batches = _batches(model, instances, batch_size)
+    if not workers:
+        for (rejected, rows) in batches:
+            yield from rejected
+            for (index, domains, constants) in rows:
+                yield index, model.solve(domains, constants, *options)
+        return
+    with ProcessPoolExecutor(workers, mp_context=process_context(), initializer=_start_batch_worker,
+                             initargs=(model,)) as pool:
+        in_flight = set()
+        exhausted = False
+        while True:
+            while not exhausted and len(in_flight) < workers * TASKS_PER_WORKER:
+                batch = next(batches, None)
+                if batch is None:
+                    exhausted = True
+                    break
+                rejected, rows = batch
+                yield from rejected
+                if rows:
+                    in_flight.add(pool.submit(_solve_batch_rows, rows, options))
+            if not in_flight:
+                break
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
+def _batches(model, instances, batch_size):
+    """ yields, for each batch of instances, the (index, None) results of those ruled out by bounds_check and
+    the (index, domains, constants) rows of the rest
+    """
+    numbered = enumerate(instances)
+    while True:
+        batch = list(itertools.islice(numbered, batch_size))
+        if not batch:
+            return
+        feasible = model.bounds_check([instance for (_, instance) in batch])
+        rejected = [(index, None) for ((index, _), ok) in zip(batch, feasible) if not ok]
+        rows = [(index, domains, constants) for ((index, (domains, constants)), ok) in zip(batch, feasible) if ok]
+        yield rejected, rows
+
+
+def _solve_rows(model, rows, options):
+    return [(index, model.solve(domains, constants, *options)) for (index, domains, constants) in rows]
+
+
+def _start_batch_worker(model):
+    _worker['model'] = model
+
+
+def _solve_batch_rows(rows, options):
+    return _solve_rows(_worker['model'], rows, options)
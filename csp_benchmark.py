@@ -0,0 +1,383 @@
+from csp import CSP
+from csp import Constraint
+from csp import FORWARD_CHECKING
+from csp import ARC_CONSISTENCY
+from csp import MINIMUM_REMAINING_VALUES
+from csp import DOM_WDEG
+from csp import LEAST_CONSTRAINING_VALUE
+from csp_squirrelnut import BEFORE_ROBBERY_VARIABLES
+from csp_squirrelnut import AFTER_ROBBERY_VARIABLES
+from csp_squirrelnut import setup_squirrel_nut_domain
+from csp_squirrelnut import setup_squirrel_nut_constraints
+from csp_squirrelnut import squirrel_nut_search_brute_force
+from csp_squirrelnut import squirrel_nut_optimized_search
+from csp_squirrelnut import squirrel_nut_batch_search
+from csp_problems import n_queens
+from csp_problems import graph_colouring
+from csp_problems import random_binary
+from csp_problems import sudoku
+from csp_problems import random_sudoku
+from csp_problems import squirrel_nuts
+from csp_problems import instance_variants
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+""" benchmarks for comparing the search modes of the CSP class.
+Each benchmark runs a search until it either finishes or has visited node_limit nodes, and reports
+how many nodes it visited and how many nodes per second that works out to.
+
+run_suite runs every search mode on problems of each family in csp_problems.py, and on the entry points of
+csp_squirrelnut.py, recording the wall time, nodes and peak memory of each run.  write_results saves these
+as JSON, and compare_results lines up two such files, say from before and after a change to the solver:
+
+    python csp_benchmark.py --suite --output before.json
+    python csp_benchmark.py --suite --output after.json
+    python csp_benchmark.py --compare before.json after.json
+
+check_regressions reruns the cases that once went wrong, and python csp_benchmark.py --check exits with status 1
+if any of them fails.
+"""
+
+NODE_LIMIT = 2000000
+SUITE_NODE_LIMIT = 200000
+
+# the fewest nodes per second the backjumping search may visit on random_sudoku(55) before check_regressions
+# reports it.  Looking up the nogoods once slowed it to a couple of thousand.
+MIN_BACKJUMP_NODES_PER_SECOND = 10000
+
+
+class NodeLimitReached(Exception):
+    pass
+
+
+class NodeLimitedCSP(CSP):
+    """ a CSP that stops the search by raising NodeLimitReached once node_limit nodes have been visited """
+    def __init__(self, variables, domains, constraints, node_limit=NODE_LIMIT):
+        super().__init__(variables, domains, constraints)
+        self.node_limit = node_limit
+
+    def start_reporting(self, interval=None):
+        super().start_reporting(interval)
+        self.next_report = min(self.next_report, self.node_limit)
+
+    def report(self, interval=None):
+        if self.counter >= self.node_limit:
+            raise NodeLimitReached()
+        super().report(interval)
+
+
+def squirrel_nut_csp(node_limit=NODE_LIMIT):
+    variables = BEFORE_ROBBERY_VARIABLES + AFTER_ROBBERY_VARIABLES
+    domain = setup_squirrel_nut_domain()
+    constraints = setup_squirrel_nut_constraints()
+    return NodeLimitedCSP(variables, domain, constraints, node_limit)
+
+
+def run_benchmark(name, csp, search):
+    """ runs search(csp) and returns a dict with the nodes visited, the elapsed time and the nodes per second """
+    start = time.perf_counter()
+    finished = True
+    try:
+        search(csp)
+    except NodeLimitReached:
+        finished = False
+    elapsed = time.perf_counter() - start
+    return {
+        'name': name,
+        'nodes': csp.counter,
+        'seconds': elapsed,
+        'nodes_per_second': csp.counter / elapsed if elapsed else 0.0,
+        'pruned': csp.pruned,
+        'finished': finished,
+    }
+
+
+def search_modes_benchmark(node_limit=NODE_LIMIT):
+    """ compares the copying search against the in-place undo-trail search on the squirrel nut model,
+    with and without propagation and ordering heuristics
+    """
+    modes = [
+        ('copying', lambda csp: csp.search_for_solution()),
+        ('in_place', lambda csp: csp.search_for_solution(in_place=True)),
+        ('backjump', lambda csp: csp.search_for_solution(backjump=True)),
+        ('compiled', lambda csp: csp.search_for_solution(compiled=True)),
+        ('fc', lambda csp: csp.search_for_solution(propagate=FORWARD_CHECKING)),
+        ('ac3', lambda csp: csp.search_for_solution(propagate=ARC_CONSISTENCY)),
+        ('fc_mrv', lambda csp: csp.search_for_solution(propagate=FORWARD_CHECKING, var_order=MINIMUM_REMAINING_VALUES)),
+        ('fc_wdeg_lcv', lambda csp: csp.search_for_solution(propagate=FORWARD_CHECKING, var_order=DOM_WDEG,
+                                                            val_order=LEAST_CONSTRAINING_VALUE)),
+    ]
+    return [run_benchmark(name, squirrel_nut_csp(node_limit), search) for (name, search) in modes]
+
+
+def tabulated(search):
+    """ returns a search that runs search on the csp after turning its constraints into lookups with CSP.tabulate,
+    so that the time taken to build the tables is counted
+    """
+    def run(csp):
+        csp.tabulate()
+        return search(csp)
+    return run
+
+
+SEARCH_MODES = [
+    ('in_place', lambda csp: csp.search_for_solution(in_place=True)),
+    ('backjump', lambda csp: csp.search_for_solution(backjump=True)),
+    ('compiled', lambda csp: csp.search_for_solution(compiled=True)),
+    ('fc', lambda csp: csp.search_for_solution(propagate=FORWARD_CHECKING)),
+    ('ac3', lambda csp: csp.search_for_solution(propagate=ARC_CONSISTENCY)),
+    ('fc_mrv', lambda csp: csp.search_for_solution(propagate=FORWARD_CHECKING, var_order=MINIMUM_REMAINING_VALUES)),
+    ('fc_wdeg_lcv', lambda csp: csp.search_for_solution(propagate=FORWARD_CHECKING, var_order=DOM_WDEG,
+                                                        val_order=LEAST_CONSTRAINING_VALUE)),
+    ('iterative_fc', lambda csp: csp.search_iterative(propagate=FORWARD_CHECKING)),
+    ('tabulated_in_place', tabulated(lambda csp: csp.search_for_solution(in_place=True))),
+    ('tabulated_fc', tabulated(lambda csp: csp.search_for_solution(propagate=FORWARD_CHECKING))),
+]
+
+# search_by_components solves each sub-problem by enumeration, so it is only run on the families that
+# split into small sub-problems.  The enumeration does not count nodes, so these runs record no nodes and
+# are not stopped by the node limit.
+COMPONENT_MODES = [
+    ('components', lambda csp: csp.search_by_components()),
+    ('tabulated_components', tabulated(lambda csp: csp.search_by_components())),
+    ('relational_components', lambda csp: csp.search_by_components(relational=True)),
+]
+
+
+def suite_problems():
+    """ returns the problems of the suite as (family, instance, make, modes), where make() returns the
+    (variables, domains, constraints) of the problem.  The sizes are kept small enough that the whole suite
+    runs in a few minutes with the default node limit.
+    """
+    squirrel_modes = SEARCH_MODES + COMPONENT_MODES
+    return [
+        ('n_queens', 'n=8', lambda: n_queens(8), SEARCH_MODES),
+        ('n_queens', 'n=12', lambda: n_queens(12), SEARCH_MODES),
+        ('graph_colouring', 'n=30,p=0.2,k=4', lambda: graph_colouring(30, 0.2, 4, seed=1), SEARCH_MODES),
+        ('graph_colouring', 'n=50,p=0.1,k=4', lambda: graph_colouring(50, 0.1, 4, seed=1), SEARCH_MODES),
+        ('random_binary', 'n=15,d=6,p1=0.5', lambda: random_binary(15, 6, 0.5, seed=1), SEARCH_MODES),
+        ('random_binary', 'n=25,d=8,p1=0.3', lambda: random_binary(25, 8, 0.3, seed=1), SEARCH_MODES),
+        ('sudoku', 'classic', lambda: sudoku(), SEARCH_MODES),
+        ('sudoku', 'holes=55', lambda: random_sudoku(55, seed=1), SEARCH_MODES),
+        ('squirrel_nuts', 'original', lambda: (BEFORE_ROBBERY_VARIABLES + AFTER_ROBBERY_VARIABLES,
+                                               setup_squirrel_nut_domain(), setup_squirrel_nut_constraints()),
+         squirrel_modes),
+        ('squirrel_nuts', 's=5,n=4', lambda: squirrel_nuts(5, 4, seed=1), squirrel_modes),
+        ('squirrel_nuts', 's=6,n=3', lambda: squirrel_nuts(6, 3, seed=1), squirrel_modes),
+    ]
+
+
+def measure(run):
+    """ calls run() twice, once timed and once under tracemalloc for the peak memory, so that tracing does not
+    slow the timed run.  run() returns the nodes it visited, or None when it cannot tell, and whether it
+    found a solution, and raises NodeLimitReached if it gave up.
+    Returns a dict with the seconds, nodes, peak_bytes, finished and solved.
+    """
+    start = time.perf_counter()
+    try:
+        nodes, solved = run()
+        finished = True
+    except NodeLimitReached as limit:
+        nodes, solved = limit.args[0], False
+        finished = False
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        run()
+    except NodeLimitReached:
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': elapsed, 'nodes': nodes, 'peak_bytes': peak, 'finished': finished, 'solved': solved}
+
+
+def run_suite(node_limit=SUITE_NODE_LIMIT, families=None, log=print):
+    """ runs every mode on every problem of suite_problems, or only those of the families named, each
+    stopped after node_limit nodes, followed by the squirrel nut entry points.  Returns a list of dicts with
+    the family, instance, mode, seconds, nodes, peak_bytes, finished and solved of each run.
+    """
+    results = []
+
+    def record(family, instance, mode, run):
+        result = {'family': family, 'instance': instance, 'mode': mode}
+        result.update(measure(run))
+        results.append(result)
+        if log:
+            log(format_result(result))
+
+    for (family, instance, make, modes) in suite_problems():
+        if families and family not in families:
+            continue
+        for (mode, search) in modes:
+            counted = (mode, search) not in COMPONENT_MODES
+
+            def run(make=make, search=search, counted=counted):
+                csp = NodeLimitedCSP(*make(), node_limit=node_limit)
+                try:
+                    solution = search(csp)
+                except NodeLimitReached:
+                    raise NodeLimitReached(csp.counter)
+                return csp.counter if counted else None, solution is not None
+            record(family, instance, mode, run)
+    if not families or 'squirrel_nuts' in families:
+        # these build their own CSP, so their nodes are not known
+        record('squirrel_nuts', 'original', 'squirrel_nut_search_brute_force',
+               lambda: (None, squirrel_nut_search_brute_force() is not None))
+        record('squirrel_nuts', 'original', 'squirrel_nut_search_brute_force(forward_checking)',
+               lambda: (None, squirrel_nut_search_brute_force(propagate=FORWARD_CHECKING) is not None))
+        record('squirrel_nuts', 'original', 'squirrel_nut_search_brute_force(backjump)',
+               lambda: (None, squirrel_nut_search_brute_force(backjump=True) is not None))
+        record('squirrel_nuts', 'original', 'squirrel_nut_optimized_search',
+               lambda: (None, squirrel_nut_optimized_search() != 'no solution'))
+        record('squirrel_nuts', 'original', 'squirrel_nut_optimized_search(relational)',
+               lambda: (None, squirrel_nut_optimized_search(relational=True) != 'no solution'))
+    return results
+
+
+def write_results(results, path, label=None):
+    """ writes the results of run_suite to path as JSON, with a label, say a commit, and the python version """
+    with open(path, 'w') as f:
+        json.dump({
+            'label': label,
+            'python': platform.python_version(),
+            'results': results,
+        }, f, indent=1)
+
+
+def compare_results(before_path, after_path):
+    """ returns, for each run found in both files of write_results, a dict with its family, instance and mode
+    and the ratios after / before of its seconds, nodes and peak_bytes (None where a ratio cannot be taken)
+    """
+    def load(path):
+        with open(path) as f:
+            return {(r['family'], r['instance'], r['mode']): r for r in json.load(f)['results']}
+
+    def ratio(after, before):
+        if after is None or not before:
+            return None
+        return after / before
+
+    before = load(before_path)
+    after = load(after_path)
+    comparison = []
+    for (key, a) in after.items():
+        if key not in before:
+            continue
+        b = before[key]
+        comparison.append({
+            'family': key[0],
+            'instance': key[1],
+            'mode': key[2],
+            'seconds': ratio(a['seconds'], b['seconds']),
+            'nodes': ratio(a['nodes'], b['nodes']),
+            'peak_bytes': ratio(a['peak_bytes'], b['peak_bytes']),
+            'finished': (b['finished'], a['finished']),
+        })
+    return comparison
+
+
+def format_result(r):
+    return '{:<16} {:<18} {:<49} {:>8} nodes {:>8.3f}s {:>10} bytes{}'.format(
+        r['family'], r['instance'], r['mode'], '-' if r['nodes'] is None else r['nodes'], r['seconds'],
+        r['peak_bytes'], '' if r['finished'] else ' (node limit)')
+
+
+def print_comparison(comparison):
+    def show(x):
+        return '-' if x is None else '{:.2f}x'.format(x)
+
+    for c in comparison:
+        print('{:<16} {:<18} {:<49} time {:>7} nodes {:>7} memory {:>7}{}'.format(
+            c['family'], c['instance'], c['mode'], show(c['seconds']), show(c['nodes']), show(c['peak_bytes']),
+            '' if c['finished'][0] == c['finished'][1] else ' (finished {} -> {})'.format(*c['finished'])))
+
+
+def batch_benchmark(count=2000, workers=None):
+    """ compares the instances per second of solving count variants of the squirrel nut puzzle one by one, each
+    built from scratch, against squirrel_nut_batch_search with and without workers
+    """
+    variables = BEFORE_ROBBERY_VARIABLES + AFTER_ROBBERY_VARIABLES
+    instances = list(instance_variants(setup_squirrel_nut_domain(), setup_squirrel_nut_constraints(), count))
+    start = time.perf_counter()
+    for (domains, constants) in instances:
+        constraints = setup_squirrel_nut_constraints()
+        for (i, rhs) in constants.items():
+            constraints[i].rhs = rhs
+        CSP(variables, domains, constraints).search_for_solution(propagate=FORWARD_CHECKING,
+                                                                 var_order=MINIMUM_REMAINING_VALUES)
+    results = [('one_by_one', count / (time.perf_counter() - start))]
+    for w in [None] + ([workers] if workers else []):
+        start = time.perf_counter()
+        for _ in squirrel_nut_batch_search(iter(instances), w):
+            pass
+        results.append(('batch' if w is None else 'batch_{}_workers'.format(w), count / (time.perf_counter() - start)))
+    return results
+
+
+def check_regressions():
+    """ reruns the cases that once went wrong and returns a description of each one that fails again """
+    failures = []
+    csp = NodeLimitedCSP(*random_sudoku(55, seed=1), node_limit=50000)
+    start = time.perf_counter()
+    try:
+        csp.search_for_solution(backjump=True)
+    except NodeLimitReached:
+        pass
+    rate = csp.counter / (time.perf_counter() - start)
+    if rate < MIN_BACKJUMP_NODES_PER_SECOND:
+        failures.append('backjumping on random_sudoku(55) visits {:.0f} nodes/s, fewer than {}'.format(
+            rate, MIN_BACKJUMP_NODES_PER_SECOND))
+    # two edits with a resolve in between that returns the previous solution: the propagated domains must still
+    # take in the first edit when the second one makes resolve search again
+    csp = CSP(['X', 'Y'], {'X': [0, 1, 2], 'Y': [0, 1, 2]},
+              [Constraint(lambda val: val['X'] != val['Y'], ['X', 'Y'])])
+    solution = csp.resolve(propagate=ARC_CONSISTENCY)
+    csp.restrict_domain('X', [solution['X']])
+    csp.resolve(propagate=ARC_CONSISTENCY)
+    csp.add_constraint(Constraint(lambda val, y=solution['Y']: val['Y'] != y, ['Y']))
+    csp.resolve(propagate=ARC_CONSISTENCY)
+    if csp.propagated != csp.make_arc_consistent():
+        failures.append('resolve after an edit that kept the previous solution propagates {}, not {}'.format(
+            csp.propagated, csp.make_arc_consistent()))
+    return failures
+
+
+def print_results(results):
+    for r in results:
+        print('{:<12} {:>10} nodes {:>8} pruned {:>8.2f}s {:>12.0f} nodes/s{}'.format(
+            r['name'], r['nodes'], r['pruned'], r['seconds'], r['nodes_per_second'],
+            '' if r['finished'] else ' (node limit)'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmarks the search modes of the CSP class')
+    parser.add_argument('--suite', action='store_true', help='run the suite of problem families')
+    parser.add_argument('--family', action='append', help='run only this family of the suite')
+    parser.add_argument('--node-limit', type=int, help='stop each search after this many nodes')
+    parser.add_argument('--output', help='write the suite results to this JSON file')
+    parser.add_argument('--label', help='the label to store with the results, e.g. a commit')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two results files')
+    parser.add_argument('--batch', type=int, metavar='COUNT', help='solve COUNT variants of the squirrel nut puzzle')
+    parser.add_argument('--workers', type=int, help='the number of processes for --batch')
+    parser.add_argument('--check', action='store_true', help='rerun the cases that once went wrong')
+    args = parser.parse_args()
+    if args.check:
+        failures = check_regressions()
+        for failure in failures:
+            print(failure)
+        sys.exit(1 if failures else 0)
+    elif args.compare:
+        print_comparison(compare_results(*args.compare))
+    elif args.batch:
+        for (name, rate) in batch_benchmark(args.batch, args.workers):
+            print('{:<20} {:>10.0f} instances/s'.format(name, rate))
+    elif args.suite or args.family:
+        results = run_suite(args.node_limit or SUITE_NODE_LIMIT, args.family)
+        if args.output:
+            write_results(results, args.output, args.label)
+    else:
+        print_results(search_modes_benchmark(args.node_limit or NODE_LIMIT))
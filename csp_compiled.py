@@ -0,0 +1,243 @@
+from array import array
+import time
+
+from csp import AllDifferent
+from csp import Constraint
+from csp import LookupConstraint
+
+""" a compiled, integer indexed form of a CSP, used to run the search with fewer hash lookups and less memory.
+
+CSP.compile() turns a CSP into a CompiledCSP:
+the variables become integer ids 0..n-1, in the order of csp.variables
+the domain of each variable becomes a tuple of its values, and its live domain a bitset (a python int)
+whose bit k is set while the value with index k is still possible
+the assignment becomes a flat preallocated array holding the index of the value assigned to each
+variable, or UNASSIGNED
+each constraint's var_list is resolved to a tuple of variable ids, and each variable keeps, for each of its
+constraints, the ids of the other variables of the constraint, so the check for whether it can be evaluated
+looks only at those in the assignment array, and the assignment and unassignment of a variable do not have to
+update anything per constraint
+each AllDifferent keeps the id of the variable it last saw given each value, as AllDifferent.is_satisfied_after
+does, so that it is checked as each of its variables is assigned, in a single lookup, rather than once all of
+them are
+the values of the variables are also kept in a dict by name, but only for the variables of the constraints
+that cannot be checked by index: those with no checker of their own (see Constraint.check), which would
+otherwise build the dict from the values at every check, those checked before all their variables are
+assigned (see Constraint.prunes_early), and the global constraints
+
+The dict based CSP is still the front end: CSP.search_for_solution(compiled=True) compiles the CSP,
+runs the search on the compiled form, and hands back the solution as a dict.
+"""
+
+UNASSIGNED = -1
+
+
+def _is_all_different(constraint):
+    if isinstance(constraint, LookupConstraint):
+        constraint = constraint.constraint
+    return isinstance(constraint, AllDifferent)
+
+
+class CompiledConstraint:
+    """ a constraint whose var_list has been resolved to the tuple of ids of its variables """
+    __slots__ = ('constraint', 'check', 'scope', 'names', 'prunes_early', 'constraint_fn', 'by_name')
+
+    def __init__(self, constraint, scope, names, by_name):
+        self.constraint = constraint
+        self.check = constraint.check
+        self.scope = scope
+        self.names = names
+        self.prunes_early = constraint.prunes_early
+        # with no checker of its own, the constraint_fn is run on the dict of the assignment directly
+        self.constraint_fn = constraint.constraint_fn if type(constraint).check is Constraint.check else None
+        self.by_name = by_name
+
+    def is_satisfied(self, value_of):
+        """ runs the checker of the constraint on the values of its variables; all of them must be assigned """
+        if self.constraint_fn is not None:
+            return self.constraint_fn(self.by_name)
+        return self.check([value_of[i] for i in self.scope])
+
+
+class CompiledCSP:
+    __slots__ = ('csp', 'names', 'index', 'values', 'domains', 'constraints', 'global_constraints',
+                 'constraints_of', 'checked_of', 'all_different_of', 'owner', 'named',
+                 'assignment', 'value_of', 'by_name')
+
+    def __init__(self, csp):
+        self.csp = csp
+        self.names = tuple(csp.variables)
+        self.index = {v: i for (i, v) in enumerate(self.names)}
+        self.values = tuple(tuple(csp.domains[v]) for v in self.names)
+        self.domains = [(1 << len(d)) - 1 for d in self.values]
+        self.by_name = {}
+        local = [c for c in csp.constraints if c.var_list]
+        self.constraints = tuple(
+            CompiledConstraint(c, tuple(self.index[v] for v in c.var_list), tuple(c.var_list), self.by_name)
+            for c in local)
+        self.global_constraints = tuple(c for c in csp.constraints if not c.var_list)
+        constraints_of = [[] for _ in self.names]
+        for (k, c) in enumerate(self.constraints):
+            for i in c.scope:
+                constraints_of[i].append(k)
+        self.constraints_of = tuple(tuple(ks) for ks in constraints_of)
+        # the AllDifferent constraints of each variable are checked through the owners of their values, and the
+        # others, in checked_of along with the other variables of each and its constraint_fn, by their checker
+        all_different = [_is_all_different(c.constraint) for c in self.constraints]
+        self.checked_of = tuple(
+            tuple((self.constraints[k], tuple(j for j in self.constraints[k].scope if j != i),
+                   self.constraints[k].constraint_fn)
+                  for k in ks if not all_different[k])
+            for (i, ks) in enumerate(constraints_of))
+        self.all_different_of = tuple(tuple(k for k in ks if all_different[k]) for ks in constraints_of)
+        self.owner = [{} if a else None for a in all_different]
+        # the variables whose values are kept in by_name, for the constraints that are not checked by index
+        named = [bool(self.global_constraints)] * len(self.names)
+        for (c, a) in zip(self.constraints, all_different):
+            if c.constraint_fn is not None or (c.prunes_early and not a):
+                for i in c.scope:
+                    named[i] = True
+        self.named = tuple(named)
+        self.assignment = array('i', [UNASSIGNED] * len(self.names))
+        self.value_of = [None] * len(self.names)
+
+    def assign(self, var, k):
+        """ assigns the value with index k to the variable with id var """
+        self.assignment[var] = k
+        value = self.values[var][k]
+        self.value_of[var] = value
+        if self.named[var]:
+            self.by_name[self.names[var]] = value
+
+    def unassign(self, var):
+        self.assignment[var] = UNASSIGNED
+        self.value_of[var] = None
+        if self.named[var]:
+            del self.by_name[self.names[var]]
+
+    def is_variable_consistent(self, var):
+        """ checks that no other variable of an AllDifferent on var holds its value, then the other constraints
+        on var whose variables are now all assigned, or that are checked before that (see Constraint.prunes_early),
+        and the global constraints
+        """
+        assignment = self.assignment
+        value_of = self.value_of
+        value = value_of[var]
+        for c in self.all_different_of[var]:
+            owner = self.owner[c]
+            other = owner.get(value, var)
+            if other != var and value_of[other] == value:
+                return False
+            owner[value] = var
+        by_name = self.by_name
+        for (constraint, others, constraint_fn) in self.checked_of[var]:
+            for i in others:
+                if assignment[i] == UNASSIGNED:
+                    if constraint.prunes_early and not constraint.constraint.is_satisfied(by_name):
+                        return False
+                    break
+            else:
+                if constraint_fn is not None:
+                    if not constraint_fn(by_name):
+                        return False
+                elif not constraint.check([value_of[i] for i in constraint.scope]):
+                    return False
+        for c in self.global_constraints:
+            if not c.constraint_fn(by_name):
+                return False
+        return True
+
+    def _timed_is_variable_consistent(self, var):
+        """ is_variable_consistent, recording each constraint it checks and the time that took in the stats of
+        the CSP, as CSP.failed_constraint does when the CSP is instrumented
+        """
+        stats = self.csp.stats
+        assignment = self.assignment
+        value_of = self.value_of
+        value = value_of[var]
+        for c in self.constraints_of[var]:
+            constraint = self.constraints[c]
+            start = time.perf_counter()
+            owner = self.owner[c]
+            if owner is not None:
+                other = owner.get(value, var)
+                satisfied = other == var or value_of[other] != value
+                if satisfied:
+                    owner[value] = var
+            elif all(assignment[i] != UNASSIGNED for i in constraint.scope):
+                satisfied = constraint.is_satisfied(value_of)
+            elif constraint.prunes_early:
+                satisfied = constraint.constraint.is_satisfied(self.by_name)
+            else:
+                continue
+            stats.record_check(constraint.constraint, time.perf_counter() - start)
+            if not satisfied:
+                return False
+        for c in self.global_constraints:
+            start = time.perf_counter()
+            satisfied = c.constraint_fn(self.by_name)
+            stats.record_check(c, time.perf_counter() - start)
+            if not satisfied:
+                return False
+        return True
+
+    def to_dict(self):
+        """ returns the current assignment as a dict from variable name to value, as used by CSP """
+        return {self.names[i]: value for (i, value) in enumerate(self.value_of) if self.assignment[i] != UNASSIGNED}
+
+    def load(self, assignment):
+        """ clears the current assignment and then assigns the values of the dict assignment provided.
+        Returns False if one of the values is not in the domain of its variable.
+        """
+        for i in range(len(self.names)):
+            if self.assignment[i] != UNASSIGNED:
+                self.unassign(i)
+        for (name, value) in assignment.items():
+            i = self.index[name]
+            if value not in self.values[i]:
+                return False
+            self.assign(i, self.values[i].index(value))
+        return True
+
+    def search_for_solution(self, assignment={}, interval=None):
+        """ runs a backtracking search over the variables in the order of csp.variables, starting from the
+        dict assignment provided, and returns the solution as a dict, or None if there is none
+        """
+        self.csp.start_reporting(interval)
+        if not self.load(assignment):
+            return None
+        order = [i for i in range(len(self.names)) if self.assignment[i] == UNASSIGNED]
+        for i in range(len(self.names)):
+            if self.assignment[i] != UNASSIGNED and not self.is_variable_consistent(i):
+                return None
+        if self._search(order, 0, interval):
+            self.csp._found_solution()
+            return self.to_dict()
+        return None
+
+    def _search(self, order, depth, interval):
+        """ searches the variables of order from depth on.  When the CSP is instrumented the checks are timed
+        and the backtracks recorded in its stats, at the depths the other searches record them at
+        """
+        if depth == len(order):
+            return True
+        var = order[depth]
+        domain = self.domains[var]
+        csp = self.csp
+        stats = csp.stats
+        consistent = self.is_variable_consistent if stats is None else self._timed_is_variable_consistent
+        k = 0
+        while domain:
+            if domain & 1:
+                self.assign(var, k)
+                csp.counter = csp.counter + 1
+                if csp.counter >= csp.next_report:
+                    csp.report(interval)
+                if consistent(var) and self._search(order, depth + 1, interval):
+                    return True
+                self.unassign(var)
+            domain = domain >> 1
+            k = k + 1
+        if stats is not None:
+            stats.record_backtrack(len(self.names) - len(order) + depth + 1)
+        return False
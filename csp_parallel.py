@@ -0,0 +1,267 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+import multiprocessing
+import sys
+
+from csp import CSP
+from csp import first_component_solution
+from csp import LEAST_CONSTRAINING_VALUE
+from csp import merge_list_of_maps
+
+""" parallel search for the CSP class, run on a pool of worker processes.
+
+search_parallel splits the search tree of CSP.search_for_solution into subtrees, one for each consistent
+assignment of the first few unassigned variables (a prefix), and searches each subtree in place in a worker.
+search_by_components_parallel solves the independent sub-problems of CSP.search_by_components in the
+workers, and then splits the search over the combinations of their solutions into chunks of the solutions of
+the first component.
+
+Either way the work is a stream of numbered tasks.  They are handed out a few at a time as workers become free,
+so a worker that is given small subtrees simply takes more of them.  Once a task finds a solution, the tasks
+numbered after it are cancelled: those not yet started are dropped, and those running notice through a shared
+value that their CSP checks every CHECK_INTERVAL nodes.  The tasks numbered before it are still waited for, and
+the solution of the lowest numbered task that has one is returned.  The number of tasks does not depend on the
+number of workers, so neither does the solution.
+
+Where the platform can fork, the workers inherit the CSP instead of receiving a pickled copy of it, so constraints
+built from lambdas can be used.  Elsewhere the constraints must be picklable, as the arithmetic constraint
+types are.
+"""
+
+TASKS = 256
+TASKS_PER_WORKER = 2
+COMBINATION_CHUNK = 64
+CHECK_INTERVAL = 1000
+
+# the state of a worker process, set up by the initializer of its pool
+_worker = {}
+
+
+class SearchCancelled(Exception):
+    pass
+
+
+class CancellableCSP(CSP):
+    """ a CSP whose search stops by raising SearchCancelled once a task numbered before its own task has
+    found a solution
+    """
+    __slots__ = ('best', 'task')
+
+    def __init__(self, variables, domains, constraints, best):
+        super().__init__(variables, domains, constraints)
+        self.best = best
+        self.task = 0
+
+    def start_reporting(self, interval=None):
+        self.next_report = self.counter + CHECK_INTERVAL
+
+    def report(self, interval=None):
+        self.start_reporting(interval)
+        if self.best.value < self.task:
+            raise SearchCancelled()
+
+    def start_task(self, task):
+        """ resets the per-task state, so that a task gives the same result whichever worker runs it """
+        self.task = task
+        self.counter = 0
+        self.forget()
+        self.start_reporting()
+
+
+def process_context():
+    """ the multiprocessing context the worker pools are started with: fork where the platform has it, so the
+    workers inherit the CSP, and the default start method elsewhere
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+def prefix_variables(csp, assignment):
+    """ returns the first unassigned variables of csp.variables, as few as give at least TASKS combinations """
+    variables = []
+    size = 1
+    for v in csp.variables:
+        if size >= TASKS:
+            break
+        if v not in assignment:
+            variables.append(v)
+            size = size * len(csp.domains[v])
+    return variables
+
+
+def prefixes(csp, assignment, variables):
+    """ yields the assignments of variables that extend assignment and are consistent, in the order of the
+    domains, that is the order the search would come to them in
+    """
+    local_assignment = dict(assignment)
+
+    def extend(depth):
+        if depth == len(variables):
+            yield dict(local_assignment)
+            return
+        var = variables[depth]
+        for value in csp.domains[var]:
+            local_assignment[var] = value
+            if csp.is_variable_consistent(var, local_assignment):
+                yield from extend(depth + 1)
+        local_assignment.pop(var, None)
+
+    yield from extend(0)
+
+
+def first_in_order(csp, pool, tasks, best, workers):
+    """ submits the tasks, pairs of a function and its arguments, to the pool with their number as first
+    argument, keeping at most TASKS_PER_WORKER tasks per worker in flight.  Each task returns its number, its
+    solution or None, and the nodes it visited, which are added to csp.counter.
+    Returns the solution of the lowest numbered task that has one, or None.
+    """
+    tasks = iter(tasks)
+    submitted = 0
+    exhausted = False
+    in_flight = {}
+    finished = set()
+    solutions = {}
+    lowest_unfinished = 0
+    while True:
+        while not exhausted and len(in_flight) < workers * TASKS_PER_WORKER and submitted < best.value:
+            task = next(tasks, None)
+            if task is None:
+                exhausted = True
+                break
+            fn, args = task
+            in_flight[pool.submit(fn, submitted, *args)] = submitted
+            submitted = submitted + 1
+        if not in_flight:
+            break
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            del in_flight[future]
+            if future.cancelled():
+                continue
+            index, solution, nodes = future.result()
+            csp.counter = csp.counter + nodes
+            finished.add(index)
+            if solution is not None:
+                solutions[index] = solution
+                if index < best.value:
+                    best.value = index
+                    for (f, i) in in_flight.items():
+                        if i > index:
+                            f.cancel()
+        while lowest_unfinished in finished:
+            lowest_unfinished = lowest_unfinished + 1
+        if lowest_unfinished >= best.value:
+            break
+    if best.value in solutions:
+        return solutions[best.value]
+    return None
+
+
+def search_parallel(csp, assignment={}, workers=None, interval=None, propagate=None, var_order=None,
+                    val_order=None, backjump=False):
+    """ searches for a solution with CSP.search_in_place in workers processes, one subtree per prefix.
+    Without a var_order or val_order the solution is the one search_in_place finds.
+    """
+    variables = prefix_variables(csp, assignment)
+    if not variables:
+        return csp.search_in_place(assignment, interval, propagate, var_order, val_order, backjump)
+    context = process_context()
+    best = context.Value('q', sys.maxsize)
+    tasks = ((_search_subtree, (prefix, interval, propagate, var_order, val_order, backjump))
+             for prefix in prefixes(csp, assignment, variables))
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_start_search_worker,
+                             initargs=(csp, best)) as pool:
+        return first_in_order(csp, pool, tasks, best, workers)
+
+
+def _start_search_worker(csp, best):
+    _worker['csp'] = CancellableCSP(csp.variables, csp.domains, csp.constraints, best)
+
+
+def _search_subtree(index, prefix, interval, propagate, var_order, val_order, backjump):
+    csp = _worker['csp']
+    csp.start_task(index)
+    if csp.best.value < index:
+        return index, None, 0
+    try:
+        solution = csp.search_in_place(prefix, interval, propagate, var_order, val_order, backjump)
+    except SearchCancelled:
+        solution = None
+    return index, solution, csp.counter
+
+
+def search_by_components_parallel(csp, workers=None, interval=None, var_order=None, val_order=None,
+                                  relational=False):
+    """ runs CSP.search_by_components with the sub-problems solved, and their solutions combined, in workers
+    processes
+    """
+    sub_problems = csp.sub_problems()
+    global_constraints = csp.global_constraints()
+    context = process_context()
+    first_only = [not global_constraints] * len(sub_problems)
+    relational = [relational] * len(sub_problems)
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_start_component_worker,
+                             initargs=(sub_problems,)) as pool:
+        tables = list(pool.map(_solve_component, range(len(sub_problems)), first_only, relational,
+                               [var_order] * len(sub_problems), [val_order] * len(sub_problems)))
+    if any(len(t) == 0 for t in tables):
+        return None
+    if not global_constraints:
+        return merge_list_of_maps([t[0] for t in tables])
+    if val_order == LEAST_CONSTRAINING_VALUE:
+        tables = csp._order_component_solutions(tables, global_constraints)
+    first = csp._pick_component(tables, list(range(len(tables))), [1] * len(tables), var_order)
+    rows = tables[first]
+    best = context.Value('q', sys.maxsize)
+    tasks = ((_link_chunk, (rows[i:i + COMBINATION_CHUNK], first, interval, var_order))
+             for i in range(0, len(rows), COMBINATION_CHUNK))
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_start_link_worker,
+                             initargs=(csp, tables, best)) as pool:
+        return first_in_order(csp, pool, tasks, best, workers)
+
+
+def _start_component_worker(sub_problems):
+    _worker['sub_problems'] = sub_problems
+
+
+def _solve_component(index, first_only, relational, var_order, val_order):
+    sub = _worker['sub_problems'][index]
+    if relational:
+        solutions = sub.relational_assignments()
+        return solutions[:1] if first_only else solutions
+    if first_only:
+        first = first_component_solution(sub, var_order, val_order)
+        return [] if first is None else [first]
+    return sub.all_assignments()
+
+
+def _start_link_worker(csp, tables, best):
+    _worker['csp'] = CancellableCSP(csp.variables, csp.domains, csp.constraints, best)
+    _worker['tables'] = tables
+
+
+def _link_chunk(index, rows, first, interval, var_order):
+    """ runs the combination search of CSP.search_by_components for the solutions rows of the first component """
+    csp = _worker['csp']
+    tables = _worker['tables']
+    csp.start_task(index)
+    global_constraints = csp.global_constraints()
+    remaining = [i for i in range(len(tables)) if i != first]
+    weights = [1] * len(tables)
+    assignment = {}
+    try:
+        for partial in rows:
+            assignment.update(partial)
+            csp.counter = csp.counter + 1
+            if csp.counter >= csp.next_report:
+                csp.report(interval)
+            if all(c.is_satisfied(assignment) for c in global_constraints) and csp._link_components(
+                    tables, remaining, weights, assignment, global_constraints, interval, var_order):
+                return index, assignment, csp.counter
+            for v in partial:
+                del assignment[v]
+    except SearchCancelled:
+        pass
+    return index, None, csp.counter
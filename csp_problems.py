@@ -0,0 +1,181 @@
+from csp import Constraint
+from csp import LinearEq
+from csp import Offset
+from csp import LessThan
+from csp import AllDifferent
+from csp import Ratio
+import random
+
+""" generators of families of CSPs of any size, used by csp_benchmark.py to see how the search modes scale.
+
+Each generator returns a tuple (variables, domains, constraints) ready to be passed to CSP, in the same form
+as setup_squirrel_nut_domain and setup_squirrel_nut_constraints.  Generators that take a seed are random
+but reproducible: the same arguments always give the same problem.
+"""
+
+
+def n_queens(n):
+    """ n queens on an n x n board, none attacking another.  Variable Q<i> is the column of the queen in row i. """
+    variables = ['Q{}'.format(i) for i in range(n)]
+    domains = {v: list(range(n)) for v in variables}
+    constraints = [AllDifferent(variables)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            a = variables[i]
+            b = variables[j]
+            x = lambda val, a=a, b=b, d=j - i: abs(val[a] - val[b]) != d
+            constraints.append(Constraint(x, [a, b]))
+    return variables, domains, constraints
+
+
+def graph_colouring(nodes, edge_probability, colours, seed=0):
+    """ colours the nodes of a random graph, with each pair of nodes joined by an edge with the probability
+    given, so that the two ends of every edge have different colours
+    """
+    rng = random.Random(seed)
+    variables = ['N{}'.format(i) for i in range(nodes)]
+    domains = {v: list(range(colours)) for v in variables}
+    constraints = []
+    for i in range(nodes):
+        for j in range(i + 1, nodes):
+            if rng.random() < edge_probability:
+                constraints.append(AllDifferent([variables[i], variables[j]]))
+    return variables, domains, constraints
+
+
+def critical_tightness(variables, domain_size, density):
+    """ the tightness at which random binary CSPs of that size and density are expected to have about one
+    solution, which is where they are hardest (Smith's estimate of the phase transition)
+    """
+    return 1 - domain_size ** (-2 / (density * (variables - 1)))
+
+
+def random_binary(variables, domain_size, density, tightness=None, seed=0):
+    """ a random binary CSP (model B): a fraction density of the pairs of variables are constrained, and each
+    constraint forbids a fraction tightness of the pairs of values.  By default the tightness is the critical
+    one, near the phase transition.
+    """
+    rng = random.Random(seed)
+    if tightness is None:
+        tightness = critical_tightness(variables, domain_size, density)
+    names = ['X{}'.format(i) for i in range(variables)]
+    domains = {v: list(range(domain_size)) for v in names}
+    pairs = [(a, b) for (i, a) in enumerate(names) for b in names[i + 1:]]
+    value_pairs = [(x, y) for x in range(domain_size) for y in range(domain_size)]
+    constraints = []
+    for (a, b) in rng.sample(pairs, round(density * len(pairs))):
+        forbidden = set(rng.sample(value_pairs, round(tightness * len(value_pairs))))
+        x = lambda val, a=a, b=b, forbidden=forbidden: (val[a], val[b]) not in forbidden
+        constraints.append(Constraint(x, [a, b]))
+    return names, domains, constraints
+
+
+SUDOKU = '53..7....6..195....98....6.8...6...34..8.3..17...2...6.6....28....419..5....8..79'
+
+
+def sudoku(puzzle=SUDOKU):
+    """ a 9 x 9 sudoku given as a string of 81 cells row by row, with '.' or '0' for an empty cell.
+    Variable R<r>C<c> is the digit in row r and column c.
+    """
+    variables = ['R{}C{}'.format(r, c) for r in range(9) for c in range(9)]
+    domains = {}
+    for (v, cell) in zip(variables, puzzle):
+        domains[v] = [int(cell)] if cell not in '.0' else list(range(1, 10))
+    constraints = []
+    for i in range(9):
+        constraints.append(AllDifferent(['R{}C{}'.format(i, c) for c in range(9)]))
+        constraints.append(AllDifferent(['R{}C{}'.format(r, i) for r in range(9)]))
+        rows = range(3 * (i // 3), 3 * (i // 3) + 3)
+        columns = range(3 * (i % 3), 3 * (i % 3) + 3)
+        constraints.append(AllDifferent(['R{}C{}'.format(r, c) for r in rows for c in columns]))
+    return variables, domains, constraints
+
+
+def random_sudoku(holes, seed=0):
+    """ a sudoku made by shuffling a solved grid and emptying holes of its cells, so it always has a solution """
+    rng = random.Random(seed)
+    digits = list(range(1, 10))
+    rng.shuffle(digits)
+
+    def shuffled_lines():
+        bands = rng.sample(range(3), 3)
+        return [3 * band + line for band in bands for line in rng.sample(range(3), 3)]
+
+    rows = shuffled_lines()
+    columns = shuffled_lines()
+    grid = [[digits[(3 * (r % 3) + r // 3 + c) % 9] for c in columns] for r in rows]
+    cells = [str(d) for row in grid for d in row]
+    for k in rng.sample(range(81), holes):
+        cells[k] = '.'
+    return sudoku(''.join(cells))
+
+
+def squirrel_nuts(squirrels=5, nuts=3, clues=None, seed=0):
+    """ a squirrels and nuts puzzle like the one in csp_squirrelnut.py, with any number of squirrels and types
+    of nut.  A hidden solution is drawn first, so the puzzle always has at least one: each squirrel holds a
+    different count of each nut before and after the robbery.  The clues, by default three per squirrel, are
+    sums of two squirrels' counts, before-and-after totals, differences between two squirrels and orderings,
+    all true of the hidden solution.
+    """
+    rng = random.Random(seed)
+    if clues is None:
+        clues = 3 * squirrels
+    before = {}
+    after = {}
+    domains = {}
+    hidden = {}
+    for n in range(nuts):
+        before_values = rng.sample(range(100 * (n + 2), 100 * (n + 2) + 20 * squirrels, 5), squirrels)
+        after_values = [v - rng.randrange(10, 60, 5) for v in before_values]
+        while len(set(after_values)) < squirrels:
+            after_values = [v - rng.randrange(10, 60, 5) for v in before_values]
+        for s in range(squirrels):
+            before[(s, n)] = 'S{}_Nut{}_Before'.format(s, n)
+            after[(s, n)] = 'S{}_Nut{}_After'.format(s, n)
+        before_domain = sorted(before_values, reverse=True)
+        after_domain = sorted(after_values, reverse=True)
+        for s in range(squirrels):
+            domains[before[(s, n)]] = before_domain
+            domains[after[(s, n)]] = after_domain
+            hidden[before[(s, n)]] = before_values[s]
+            hidden[after[(s, n)]] = after_values[s]
+    variables = [before[(s, n)] for s in range(squirrels) for n in range(nuts)]
+    variables = variables + [after[(s, n)] for s in range(squirrels) for n in range(nuts)]
+    constraints = []
+    for n in range(nuts):
+        constraints.append(AllDifferent([before[(s, n)] for s in range(squirrels)]))
+        constraints.append(AllDifferent([after[(s, n)] for s in range(squirrels)]))
+    for _ in range(clues):
+        n = rng.randrange(nuts)
+        a, b = rng.sample(range(squirrels), 2)
+        kind = rng.randrange(4)
+        if kind == 0:
+            pair = [before[(a, n)], before[(b, n)]]
+            constraints.append(LinearEq((1, 1), pair, hidden[pair[0]] + hidden[pair[1]]))
+        elif kind == 1:
+            four = [before[(a, n)], before[(b, n)], after[(a, n)], after[(b, n)]]
+            constraints.append(LinearEq((1, 1, -1, -1), four,
+                                        hidden[four[0]] + hidden[four[1]] - hidden[four[2]] - hidden[four[3]]))
+        elif kind == 2:
+            times = rng.choice([before, after])
+            constraints.append(Offset(times[(a, n)], times[(b, n)], hidden[times[(a, n)]] - hidden[times[(b, n)]]))
+        else:
+            times = rng.choice([before, after])
+            if hidden[times[(a, n)]] > hidden[times[(b, n)]]:
+                a, b = b, a
+            constraints.append(LessThan(times[(a, n)], times[(b, n)]))
+    return variables, domains, constraints
+
+
+def instance_variants(domains, constraints, count, drop=0.1, shift=0.05, seed=0):
+    """ yields count instances (domains, constants) of the model with the domains and constraints given, for
+    csp_batch.solve_batch: each value of each domain is dropped with probability drop, and the right hand side
+    of each LinearEq is moved by one step of 5 either way with probability shift.  A Ratio is left as it is, as
+    its right hand side is always 0.
+    """
+    rng = random.Random(seed)
+    linear = [(i, c) for (i, c) in enumerate(constraints) if isinstance(c, LinearEq) and not isinstance(c, Ratio)]
+    for _ in range(count):
+        variant = {v: [x for x in values if rng.random() >= drop] for (v, values) in domains.items()}
+        constants = {i: c.rhs + rng.choice([-5, 5]) for (i, c) in linear if rng.random() < shift}
+        yield variant, constants
@@ -0,0 +1,164 @@
+""" relational evaluation of a CSP: each constraint is a relation, the table of the combinations of values of its
+var_list that satisfy it, and the solutions are the natural join of the relations.
+
+The relations are arranged in a join tree, a maximum weight spanning tree of the graph in which two relations are
+joined by an edge weighted by the number of variables they share.  A semijoin pass up the tree and another down it
+then drop the dangling rows, those that cannot be part of any solution because they have no partner in a
+neighbouring relation, and the relations are joined along the tree with hash joins on their shared variables.
+When the hypergraph of the relations is acyclic the tree is a true join tree and the semijoins remove every
+dangling row (Yannakakis' algorithm), so every row of an intermediate result extends to a row of the join of all
+the relations, and no intermediate result holds more rows than that join.  That bounds the joins by the
+solutions of the constraints made into relations only: the constraints checked on the rows of the joins (see
+below) are not part of the reduction, and they can leave far fewer solutions than an intermediate result has
+rows.  When the hypergraph is not acyclic, the semijoins still only remove rows that cannot be part of a
+solution, and the joins, which match on every variable the two sides share, still give exactly the solutions.
+
+Constraints that are checked before all of their variables are assigned, such as AllDifferent, and the global
+constraints, would make large relations of their own, so they are not turned into relations: they are checked
+on the rows of each join instead, as soon as the join brings in one of their variables.  Variables that are in no
+relation get a relation of their own holding their domain.
+"""
+
+
+class Relation:
+    """ a table of rows, each a tuple of the values of the variables of scope in the same order """
+    __slots__ = ('scope', 'rows')
+
+    def __init__(self, scope, rows):
+        self.scope = tuple(scope)
+        self.rows = rows
+
+    def key(self, variables):
+        """ returns a function that picks out of a row of this relation the tuple of the values of variables """
+        positions = [self.scope.index(v) for v in variables]
+        return lambda row: tuple([row[i] for i in positions])
+
+    def semijoin(self, other):
+        """ drops the rows that agree with no row of other on the variables the two relations share.
+        Returns True if any row was dropped.
+        """
+        shared = [v for v in self.scope if v in other.scope]
+        if not shared:
+            return False
+        other_key = other.key(shared)
+        keys = {other_key(row) for row in other.rows}
+        key = self.key(shared)
+        rows = [row for row in self.rows if key(row) in keys]
+        dropped = len(rows) < len(self.rows)
+        self.rows = rows
+        return dropped
+
+
+def constraint_relation(csp, constraint):
+    """ the relation of the combinations of values of the var_list of constraint that satisfy it, built with
+    CSP.assignments_generator so that the propagator of the constraint narrows the values tried
+    """
+    scope = list(dict.fromkeys(constraint.var_list))
+    rows = [tuple([a[v] for v in scope]) for a in csp.assignments_generator(constraint, [{}])]
+    return Relation(scope, rows)
+
+
+def relations_and_filters(csp):
+    """ splits the constraints of csp into the relations to join and the filters to check during the join, and
+    adds a relation of its domain for each variable that is in no relation
+    """
+    relations = []
+    filters = []
+    for c in csp.constraints:
+        if not c.var_list or c.prunes_early:
+            filters.append(c)
+        else:
+            relations.append(constraint_relation(csp, c))
+    covered = set()
+    for r in relations:
+        covered.update(r.scope)
+    for v in csp.variables:
+        if v not in covered:
+            relations.append(Relation([v], [(value,) for value in csp.domains[v]]))
+    return relations, filters
+
+
+def join_tree(relations):
+    """ returns the join tree of relations as a list of (relation, parent) pairs in which every relation comes
+    after its parent, the roots having parent None.  Each tree of the forest is rooted at its largest relation,
+    and grown by Prim's algorithm, always adding the relation that shares the most variables with one already in
+    the tree; relations that share none with any of them start a new tree.
+    """
+    scopes = [set(r.scope) for r in relations]
+    remaining = list(range(len(relations)))
+    order = []
+    while remaining:
+        root = max(remaining, key=lambda i: (len(relations[i].scope), -i))
+        remaining.remove(root)
+        order.append((root, None))
+        in_tree = [root]
+        while remaining:
+            best = None
+            for i in remaining:
+                for j in in_tree:
+                    weight = len(scopes[i] & scopes[j])
+                    if weight and (best is None or weight > best[0]):
+                        best = (weight, i, j)
+            if best is None:
+                break
+            _, i, j = best
+            remaining.remove(i)
+            in_tree.append(i)
+            order.append((i, j))
+    return [(relations[i], None if j is None else relations[j]) for (i, j) in order]
+
+
+def semijoin_reduce(tree):
+    """ semijoin reduction: each parent is reduced by its children, from the leaves up, and then each child by its
+    parent, from the root down.  Returns False if some relation is left with no rows.
+    """
+    for (relation, parent) in reversed(tree):
+        if parent is not None:
+            parent.semijoin(relation)
+    for (relation, parent) in tree:
+        if parent is not None:
+            relation.semijoin(parent)
+    return all(relation.rows for (relation, _) in tree)
+
+
+def join(left, right, filters):
+    """ the hash join of the relations left and right on the variables they share, keeping only the rows that
+    satisfy the filters on the variables brought in by right.  The rows the filters drop were not dropped by the
+    semijoin reduction, so the result can be much smaller than the join of the relations (see the module docstring).
+    """
+    shared = [v for v in right.scope if v in left.scope]
+    extra = [v for v in right.scope if v not in left.scope]
+    scope = left.scope + tuple(extra)
+    right_key = right.key(shared)
+    right_extra = right.key(extra)
+    table = {}
+    for row in right.rows:
+        table.setdefault(right_key(row), []).append(right_extra(row))
+    left_key = left.key(shared)
+    checks = [c for c in filters if c.var_list is None or any(v in c.var_list for v in extra)]
+    rows = []
+    for row in left.rows:
+        for rest in table.get(left_key(row), ()):
+            joined = row + rest
+            if checks:
+                assignment = dict(zip(scope, joined))
+                if not all(c.is_satisfied(assignment) for c in checks):
+                    continue
+            rows.append(joined)
+    return Relation(scope, rows)
+
+
+def relational_assignments(csp):
+    """ returns the list of all the assignments to csp.variables that satisfy every constraint, found by joining
+    the relations of the constraints along a join tree after semijoin reduction
+    """
+    relations, filters = relations_and_filters(csp)
+    tree = join_tree(relations)
+    if not semijoin_reduce(tree):
+        return []
+    result = Relation([], [()])
+    for (relation, _) in tree:
+        result = join(result, relation, filters)
+        if not result.rows:
+            return []
+    return [dict(zip(result.scope, row)) for row in result.rows]
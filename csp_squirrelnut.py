@@ -1,8 +1,12 @@
 
 from csp import CSP
-from csp import Constraint
-from csp import all_vals_are_different
-from csp import cross_prod
+from csp import LinearEq
+from csp import Offset
+from csp import Ratio
+from csp import LessThan
+from csp import AllDifferent
+from csp_batch import BatchModel
+from csp_batch import solve_batch
 import pprint
 
 """ each of the following symbols is used to note how many of some type of nut was held by one of the squirrels 
@@ -158,105 +162,97 @@ def setup_squirrel_nut_constraints():
     (1) a function that accepts one parameter which is a set of assignments, and the function returns True if 
     the assignments satisfy the constraints, and
     (2) the list of variables that the constraint is testing
+    The sums, differences, ratios and orderings use the arithmetic constraint types LinearEq, Offset, Ratio and
+    LessThan, which can narrow the domains of their variables directly when the search propagates.
     """
     constraints = []
 
     # Constraint #0
-    # this constraint tests to confirm that the value of each variables before the robbery is unique, and also that the
-    # value of each variable after the robbery is unique
-
-    def constraint_0(val):
-        vs = [AFTER_ROBBERY_VARIABLES, BEFORE_ROBBERY_VARIABLES]
-        for s in vs:
-            vals = []
-            for v in s:
-                if v in val:
-                    vals.append(v)
-            if len(vals) != len(set(vals)):
-                return False
-        return True
-    constraints.append( Constraint(constraint_0) )
+    # each squirrel holds a different count of each type of nut, both before and after the robbery: the counts of
+    # a nut before (or after) the robbery are the five values of its domain, one per squirrel.
+    # Split per nut type since the after-robbery domains of pecans and walnuts share the value 180.
+    for robbery_variables in [BEFORE_ROBBERY_VARIABLES, AFTER_ROBBERY_VARIABLES]:
+        for nut in range(3):
+            constraints.append( AllDifferent(robbery_variables[nut::3]) )
 
     # Constraint #1
     # tests to confirm that the count of PECANS held by WEBSTER BEFORE plus the count of PECANS help by WAYNE BEFORE equals 650
-    x = lambda val : val[WEBSTER_PECAN_BEFORE] + val[WAYNE_PECAN_BEFORE] == 650
-    constraints.append( Constraint(x, [WEBSTER_PECAN_BEFORE, WAYNE_PECAN_BEFORE]))
+    constraints.append( LinearEq((1, 1), [WEBSTER_PECAN_BEFORE, WAYNE_PECAN_BEFORE], 650))
     
     # constratin #2
     # another sum total constraint
-    x = lambda val : val[WEBSTER_ACORN_BEFORE] + val[WAYNE_ACORN_BEFORE] == 825
-    constraints.append( Constraint(x, [WEBSTER_ACORN_BEFORE, WAYNE_ACORN_BEFORE]))
+    constraints.append( LinearEq((1, 1), [WEBSTER_ACORN_BEFORE, WAYNE_ACORN_BEFORE], 825))
 
     # constratin #3
     # another sum total constraint
-    x = lambda val : val[WEBSTER_WALNUT_BEFORE] + val[WAYNE_WALNUT_BEFORE] == 435
-    constraints.append( Constraint(x, [WEBSTER_WALNUT_BEFORE, WAYNE_WALNUT_BEFORE] ))
+    constraints.append( LinearEq((1, 1), [WEBSTER_WALNUT_BEFORE, WAYNE_WALNUT_BEFORE], 435))
 
     # Constraint #4
-    x = lambda val : val[WEBSTER_PECAN_BEFORE] + val[WAYNE_PECAN_BEFORE] == val[WEBSTER_PECAN_AFTER] + val[WAYNE_PECAN_AFTER] + 180
-    constraints.append( Constraint(x, [WEBSTER_PECAN_BEFORE, WAYNE_PECAN_BEFORE, WEBSTER_PECAN_AFTER, WAYNE_PECAN_AFTER] ))
+    # WEBSTER_PECAN_BEFORE + WAYNE_PECAN_BEFORE == WEBSTER_PECAN_AFTER + WAYNE_PECAN_AFTER + 180
+    constraints.append( LinearEq((1, 1, -1, -1), [WEBSTER_PECAN_BEFORE, WAYNE_PECAN_BEFORE,
+                                                  WEBSTER_PECAN_AFTER, WAYNE_PECAN_AFTER], 180))
 
     # Constraint #5    
-    x = lambda val : val[WEBSTER_ACORN_BEFORE] + val[WAYNE_ACORN_BEFORE] == val[WEBSTER_ACORN_AFTER] + val[WAYNE_ACORN_AFTER] + 100
-    constraints.append( Constraint(x, [WEBSTER_ACORN_BEFORE, WAYNE_ACORN_BEFORE, WEBSTER_ACORN_AFTER, WAYNE_ACORN_AFTER] ))
+    constraints.append( LinearEq((1, 1, -1, -1), [WEBSTER_ACORN_BEFORE, WAYNE_ACORN_BEFORE,
+                                                  WEBSTER_ACORN_AFTER, WAYNE_ACORN_AFTER], 100))
 
     # Constraint #6
-    x = lambda val : val[WEBSTER_WALNUT_BEFORE] + val[WAYNE_WALNUT_BEFORE] == val[WEBSTER_WALNUT_AFTER] + val[WAYNE_WALNUT_AFTER] + 57
-    constraints.append( Constraint(x, [WEBSTER_WALNUT_BEFORE, WAYNE_WALNUT_BEFORE, WEBSTER_WALNUT_AFTER, WAYNE_WALNUT_AFTER] ))
+    constraints.append( LinearEq((1, 1, -1, -1), [WEBSTER_WALNUT_BEFORE, WAYNE_WALNUT_BEFORE,
+                                                  WEBSTER_WALNUT_AFTER, WAYNE_WALNUT_AFTER], 57))
 
     # Constraint #7
-    x = lambda val : val[WILSON_PECAN_BEFORE] + 50 ==  val[WEBSTER_PECAN_BEFORE]
-    constraints.append( Constraint(x, [WEBSTER_PECAN_BEFORE, WILSON_PECAN_BEFORE]))
+    # WEBSTER_PECAN_BEFORE == WILSON_PECAN_BEFORE + 50
+    constraints.append( Offset(WEBSTER_PECAN_BEFORE, WILSON_PECAN_BEFORE, 50))
 
     # Constraint #8
-    x = lambda val : val[WILMA_PECAN_BEFORE] + 125 ==  val[WAYNE_PECAN_BEFORE]
-    constraints.append( Constraint(x, [WILMA_PECAN_BEFORE, WAYNE_PECAN_BEFORE]))
+    constraints.append( Offset(WAYNE_PECAN_BEFORE, WILMA_PECAN_BEFORE, 125))
     
     # Constraint #9
-    x = lambda val : val[WAYNE_PECAN_AFTER] ==  val[WEEZIE_PECAN_AFTER] + 20
-    constraints.append( Constraint(x, [WAYNE_PECAN_AFTER, WEEZIE_PECAN_AFTER]))
+    constraints.append( Offset(WAYNE_PECAN_AFTER, WEEZIE_PECAN_AFTER, 20))
     
     # Constraint #10
-    x = lambda val : val[WEEZIE_PECAN_AFTER] == val[WILSON_PECAN_AFTER] + 20
-    constraints.append( Constraint(x, [WEEZIE_PECAN_AFTER, WILSON_PECAN_AFTER]))
+    constraints.append( Offset(WEEZIE_PECAN_AFTER, WILSON_PECAN_AFTER, 20))
     
     # Constraint #11
-    x = lambda val : val[WILSON_ACORN_BEFORE] >  val[WEEZIE_ACORN_BEFORE]
-    constraints.append( Constraint(x, [WILSON_ACORN_BEFORE, WEEZIE_ACORN_BEFORE]))
+    # WILSON_ACORN_BEFORE > WEEZIE_ACORN_BEFORE
+    constraints.append( LessThan(WEEZIE_ACORN_BEFORE, WILSON_ACORN_BEFORE))
 
     # Constraint #12
-    x = lambda val : val[WEEZIE_ACORN_BEFORE] > val[WILMA_ACORN_BEFORE]
-    constraints.append( Constraint(x, [WEEZIE_ACORN_BEFORE, WILMA_ACORN_BEFORE]))
+    constraints.append( LessThan(WILMA_ACORN_BEFORE, WEEZIE_ACORN_BEFORE))
 
     # Constraint #13
-    x = lambda val :  val[WAYNE_ACORN_BEFORE]  == (val[WILSON_ACORN_BEFORE] * 4/5)
-    constraints.append( Constraint(x, [WAYNE_ACORN_BEFORE, WILSON_ACORN_BEFORE]))
+    # WAYNE_ACORN_BEFORE == WILSON_ACORN_BEFORE * 4/5
+    constraints.append( Ratio(WAYNE_ACORN_BEFORE, WILSON_ACORN_BEFORE, 4, 5))
 
     # Constraint #14
-    x = lambda val : val[WEEZIE_ACORN_AFTER] ==  val[WAYNE_ACORN_AFTER] + 30
-    constraints.append( Constraint(x, [WEEZIE_ACORN_AFTER, WAYNE_ACORN_AFTER]))
+    constraints.append( Offset(WEEZIE_ACORN_AFTER, WAYNE_ACORN_AFTER, 30))
 
     # Constraint #15
-    x = lambda val : val[WILSON_ACORN_AFTER] == val[WEBSTER_ACORN_AFTER] + 15
-    constraints.append( Constraint(x, [WILSON_ACORN_AFTER, WEBSTER_ACORN_AFTER]))
+    constraints.append( Offset(WILSON_ACORN_AFTER, WEBSTER_ACORN_AFTER, 15))
 
     # Constraint #16
-    x = lambda val : val[WAYNE_WALNUT_AFTER] + 2 == val[WAYNE_WALNUT_BEFORE]
-    constraints.append( Constraint(x, [WAYNE_WALNUT_AFTER, WAYNE_WALNUT_BEFORE]))
+    constraints.append( Offset(WAYNE_WALNUT_BEFORE, WAYNE_WALNUT_AFTER, 2))
 
     # Constraint #17
-    x = lambda val : val[WEEZIE_WALNUT_AFTER] + 70 == val[WEEZIE_WALNUT_BEFORE]
-    constraints.append( Constraint(x, [WEEZIE_WALNUT_AFTER, WEEZIE_WALNUT_BEFORE]))
+    constraints.append( Offset(WEEZIE_WALNUT_BEFORE, WEEZIE_WALNUT_AFTER, 70))
 
     # Constraint #18
-    x = lambda val : val[WILSON_WALNUT_AFTER] + 20 == val[WILSON_WALNUT_BEFORE]
-    constraints.append( Constraint(x, [WILSON_WALNUT_AFTER, WILSON_WALNUT_BEFORE]))
+    constraints.append( Offset(WILSON_WALNUT_BEFORE, WILSON_WALNUT_AFTER, 20))
     return constraints
 
-def squirrel_nut_search_brute_force(): 
+def squirrel_nut_search_brute_force(var_order=None, val_order=None, propagate=None, workers=None, backjump=False): 
     """executes a full brute force search of the entire search space of possible 
     combinations
 
+    Args:
+        var_order: the variable ordering heuristic, e.g. MINIMUM_REMAINING_VALUES (see CSP.search_in_place)
+        val_order: the value ordering heuristic, e.g. LEAST_CONSTRAINING_VALUE
+        propagate: the propagation to run after each assignment, e.g. FORWARD_CHECKING.  MINIMUM_REMAINING_VALUES
+            and DOM_WDEG only tell variables apart once propagation has pruned their domains.
+        workers: the number of processes to split the search over, or None to search in this process
+        backjump: whether to jump back over the variables that played no part in a dead end, and reject
+            the values already found to fail (see CSP.search_in_place).  It cannot be combined with propagate.
+
     Returns:
         dict: the assignments of values to the variables reprsenting the solution
     """
@@ -264,25 +260,33 @@ def squirrel_nut_search_brute_force():
     domain = setup_squirrel_nut_domain()
     constraints = setup_squirrel_nut_constraints()
     csp = CSP(variables, domain, constraints)
-    solution = csp.search_for_solution()
+    solution = csp.search_for_solution(var_order=var_order, val_order=val_order, propagate=propagate,
+                                       workers=workers, backjump=backjump)
     return solution
 
-def merge_list_of_maps(list_of_maps):
-    combined = {}
-    for amap in list_of_maps:
-        combined.update(amap)
-    return combined
-
-def squirrel_nut_optimized_search(): 
+def squirrel_nut_optimized_search(var_order=None, val_order=None, workers=None, relational=False): 
     """is an optimized search that considers how certain constraints only have an impact on a subset of
-    the variables.   We define the set of constraint groups, where each constraint group contains those 
+    the variables.   The CSP splits the constraints into groups, where each constraint group contains those 
     constraints that are connected by virtue of them each impacting the same variable.
     So, for example, constraint 6 is in the same group as constraint 3, because they each constrain the 
     common variables WEBSTER_WALNUT_BEFORE and WAYNE_WALNUT_BEFORE.  
     Similarly, constraint 16 is also in the same group because it too also constrains the varaible WAYNE_WALNUT_BEFORE.
 
-    constraint #18 is in a group by itself, because it contrains the variables WILSON_WALNUT_AFTER and 
-    WILSON_WALNUT_BEFORE, and there are no other constraints that also constrain those two variables.
+    constraint #18 is in that group as well, because the all-different constraint #0 on the walnuts after the
+    robbery links WILSON_WALNUT_AFTER to WAYNE_WALNUT_AFTER.  With the all-different constraints split per
+    nut type, the groups are the pecans, the acorns and the walnuts.
+
+    The groups are found by CSP.sub_problems from the var_list of each constraint, and each group is solved
+    on its own before CSP.search_by_components combines them.  The puzzle has no global constraints, so the
+    first solution of each group is taken as it is, and there is no search over their combinations.
+
+    Args:
+        var_order: the variable ordering heuristic for the search of each group, e.g. MINIMUM_REMAINING_VALUES
+            (see CSP.search_by_components); without either heuristic the groups are solved by enumeration
+        val_order: the value ordering heuristic for the search of each group, e.g. LEAST_CONSTRAINING_VALUE
+        workers: the number of processes to solve the groups and combine them in, or None for this process
+        relational: whether to solve each group by joining the tables of its constraints along a join tree
+            (see CSP.relational_assignments) rather than adding its constraints one at a time
 
     Returns:
         dict: the assignments of values to the variables reprsenting the solution
@@ -291,29 +295,36 @@ def squirrel_nut_optimized_search():
     domain = setup_squirrel_nut_domain()
     constraints = setup_squirrel_nut_constraints()
     csp = CSP(variables, domain, constraints)
-
-    constraint_groups = []
-    constraint_groups.append([5,2,14,15,13,11,12])
-    constraint_groups.append([6,3,16])
-    constraint_groups.append([4,1,7,8,9,10])
-    constraint_groups.append([17])
-    constraint_groups.append([18])
-
-    all_group_assignments = []
-    for constr_group in constraint_groups:
-        assignments_list = [{}]
-        for constraint in constr_group:
-            assignments = csp.assignments_generator(constraints[constraint], assignments_list)
-            assignments_list = list(assignments)
-        all_group_assignments.append(assignments_list)
-    combined_assignments = cross_prod(all_group_assignments)
-    for combination in combined_assignments:
-        combined_assignment = merge_list_of_maps(combination)
-        solution = csp.search_for_solution(combined_assignment)
-        if solution:
-            return solution
+    solution = csp.search_by_components(var_order=var_order, val_order=val_order, workers=workers,
+                                        relational=relational)
+    if solution:
+        return solution
     return "no solution"
 
+def squirrel_nut_model():
+    """ the squirrel nut puzzle as a BatchModel, whose instances are variants of the puzzle with other domains
+    and other totals and differences in the constraints (see csp_batch.py)
+    """
+    variables = BEFORE_ROBBERY_VARIABLES + AFTER_ROBBERY_VARIABLES
+    return BatchModel(variables, setup_squirrel_nut_constraints())
+
+def squirrel_nut_batch_search(instances, workers=None):
+    """solves many variants of the puzzle, building the model only once
+
+    Args:
+        instances: an iterable of (domains, constants) pairs, where domains is a dict like the one returned by
+            setup_squirrel_nut_domain and constants maps the position of a sum or difference constraint in the
+            list returned by setup_squirrel_nut_constraints to the total or difference for that variant.
+            Constraint #0 there is six AllDifferent constraints, one per nut before and after the robbery, so
+            the position of constraint #N, for N from 1, is N + 5: the Ratio of constraint #13 is at 18.
+        workers: the number of processes to solve the variants in, or None for this process
+
+    Returns:
+        generator: (index, solution) pairs, in the order the variants are solved, where index is the position
+            of the variant in instances and solution is None if it has no solution
+    """
+    return solve_batch(squirrel_nut_model(), instances, workers)
+
 if __name__ == '__main__':
     solution = squirrel_nut_optimized_search()
     pprint.pprint(solution)